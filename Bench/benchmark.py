@@ -0,0 +1,299 @@
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import tracemalloc
+
+# 流水线相关模块放在Page目录下，与页面共用
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, os.path.join(ROOT_DIR, "Page"))
+
+from pipeline import create_run_metrics, run_prd  # noqa: E402
+from stream_parser import CaseRowParser  # noqa: E402
+from cases import data_rows, format_testcases  # noqa: E402
+from dedup import DEFAULT_THRESHOLD, dedupe_testcases  # noqa: E402
+from exporter import export_cases  # noqa: E402
+from prd_parser import PRD_SUFFIXES, extract_document  # noqa: E402
+import config_store  # noqa: E402
+from client_pool import close_all, run_coroutine  # noqa: E402
+from mock_llm import HEADER, SEPARATOR, case_row  # noqa: E402
+
+# 离线基准测试：启动mock_llm.py模拟模型接口，对不同长度的需求文档执行生成-评审流水线，
+# 再对得到的模型输出和用例分别测试解析、去重和xlsx导出，输出吞吐量、p50/p95耗时和内存峰值（tracemalloc）。
+# 内存统计会拖慢执行，只关心耗时时可以用--no-memory关闭。
+# 用--output保存结果，之后用--baseline对比，p95耗时或内存峰值超出基线的tolerance比例时返回非0，供上线前检查性能回退
+TEMPLATES_DIR = os.path.join(ROOT_DIR, "Templates")
+# 生成的需求文档：名称 -> 章节数
+CORPUS_SIZES = {"small": 2, "medium": 10, "large": 40}
+SECTION_TEXT = ("用户在{name}页面中可以查看、新增、编辑和删除记录。新增时必填项为空应提示错误，"
+                "名称长度不超过50个字符，重复名称不允许保存。列表支持按时间排序和分页，每页20条，"
+                "删除前需要二次确认，删除后记录不可恢复。无权限的用户访问该页面时跳转到登录页。")
+# 解析、去重和导出的用例规模
+SYNTHETIC_CASES = 2000
+STREAM_CHUNK_CHARS = 8
+METRIC_KEYS = ("p95", "peak_mb")
+
+
+def make_prd(sections):
+    parts = []
+    for i in range(1, sections + 1):
+        name = f"功能{i}"
+        parts.append(f"## {i}. {name}\n{SECTION_TEXT.format(name=name)}")
+    return "# 需求文档\n\n" + "\n\n".join(parts)
+
+
+# 读取目录下的需求文档，未指定目录时按CORPUS_SIZES生成
+def load_corpus(path=None):
+    if not path:
+        return [{"id": name, "prd": make_prd(sections)} for name, sections in CORPUS_SIZES.items()]
+    corpus = []
+    for name in sorted(os.listdir(path)):
+        if os.path.splitext(name)[1].lower().lstrip(".") in PRD_SUFFIXES:
+            with open(os.path.join(path, name), 'rb') as f:
+                corpus.append({"id": name, "prd": extract_document(f.read(), name)["text"]})
+    return corpus
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+# 在子进程中启动模拟接口，避免其内存分配计入tracemalloc
+def start_mock(port, mock_args):
+    process = subprocess.Popen([sys.executable, os.path.join(BENCH_DIR, "mock_llm.py"), "--port", str(port),
+                                *mock_args], stdout=subprocess.DEVNULL)
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("模拟模型接口启动失败")
+
+
+def mock_role(config_file, prompt_file, model_select, base_url):
+    config = config_store.load_json(os.path.join(TEMPLATES_DIR, config_file))
+    config[model_select].update({"base_url": base_url, "api_key": "mock", "max_concurrency": 64})
+    return {"config": config, "model_select": model_select,
+            "prompt": config_store.load_text(os.path.join(TEMPLATES_DIR, prompt_file)), "use_cache": False}
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, round(q * (len(ordered) - 1)))]
+
+
+# 执行func并记录耗时和执行期间新增的内存峰值，返回 (结果, 耗时, 峰值字节数)；未开启tracemalloc时峰值为0
+def measure(func, *args):
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - start
+    return result, elapsed, tracemalloc.get_traced_memory()[1] - baseline if tracing else 0
+
+
+def summarize(name, latencies, items, wall_time, peak, unit):
+    return {
+        "name": name,
+        "runs": len(latencies),
+        "items": items,
+        "unit": unit,
+        "throughput": round(items / wall_time, 2) if wall_time else 0,
+        "p50": round(percentile(latencies, 0.5), 4),
+        "p95": round(percentile(latencies, 0.95), 4),
+        "peak_mb": round(peak / 1024 / 1024, 2),
+    }
+
+
+def bench_pipeline(corpus, gen_role, review_role, repeat, concurrency, section_tokens):
+    semaphore = None
+    latencies = []
+    results = []
+
+    async def run_one(item):
+        async with semaphore:
+            start = time.perf_counter()
+            metrics = create_run_metrics(gen_role, review_role, label=item["id"])
+            parsed = []
+            response, case_list = await run_prd(item["prd"], gen_role, review_role, section_tokens=section_tokens,
+                                                metrics=metrics, on_rows=parsed.extend)
+            latencies.append(time.perf_counter() - start)
+            results.append({"response": response, "case_list": case_list})
+
+    async def run_all():
+        nonlocal semaphore
+        semaphore = asyncio.Semaphore(concurrency)
+        await asyncio.gather(*(run_one(item) for item in corpus for _ in range(repeat)))
+
+    _, wall_time, peak = measure(run_coroutine, run_all())
+    cases = sum(len(result["case_list"]) for result in results)
+    return summarize("pipeline", latencies, cases, wall_time, peak, "cases"), results
+
+
+# 以流式片段和完整发言两种方式解析模型输出，与页面的处理相同
+def bench_parsing(responses, rounds):
+    latencies = []
+    total_chars = sum(len(response) for response in responses) * rounds
+
+    def parse_all():
+        for _ in range(rounds):
+            for response in responses:
+                start = time.perf_counter()
+                parser = CaseRowParser(on_rows=lambda rows: None)
+                for i in range(0, len(response), STREAM_CHUNK_CHARS):
+                    parser.feed(response[i:i + STREAM_CHUNK_CHARS])
+                parser.feed_message(response)
+                parser.flush()
+                format_testcases(response)
+                latencies.append(time.perf_counter() - start)
+
+    _, wall_time, peak = measure(parse_all)
+    return summarize("parsing", latencies, total_chars, wall_time, peak, "chars")
+
+
+# 合成的用例，每10条中有1条与上一条近似重复
+def synthetic_cases(count):
+    case_list = [HEADER, SEPARATOR]
+    for i in range(1, count + 1):
+        case_list.append(case_row("基准", i, i - 1 if i % 10 == 0 else i))
+    return case_list
+
+
+def bench_dedupe(case_lists, threshold, rounds):
+    latencies = []
+
+    def dedupe_all():
+        for _ in range(rounds):
+            for case_list in case_lists:
+                start = time.perf_counter()
+                dedupe_testcases(case_list, threshold)
+                latencies.append(time.perf_counter() - start)
+
+    _, wall_time, peak = measure(dedupe_all)
+    cases = sum(len(data_rows(case_list)) for case_list in case_lists) * rounds
+    return summarize("dedupe", latencies, cases, wall_time, peak, "cases")
+
+
+def bench_export(case_lists, rounds, fmt="xlsx"):
+    latencies = []
+
+    def export_all():
+        for _ in range(rounds):
+            for case_list in case_lists:
+                start = time.perf_counter()
+                export_cases(case_list, fmt)
+                latencies.append(time.perf_counter() - start)
+
+    _, wall_time, peak = measure(export_all)
+    cases = sum(len(data_rows(case_list)) for case_list in case_lists) * rounds
+    return summarize(f"export_{fmt}", latencies, cases, wall_time, peak, "cases")
+
+
+def print_report(results):
+    print(f"{'测试项':<12}{'次数':>6}{'吞吐量':>18}{'p50(s)':>10}{'p95(s)':>10}{'内存峰值(MB)':>14}")
+    for result in results:
+        throughput = f"{result['throughput']} {result['unit']}/s"
+        print(f"{result['name']:<14}{result['runs']:>6}{throughput:>20}{result['p50']:>10}{result['p95']:>10}"
+              f"{result['peak_mb']:>14}")
+
+
+# 与基线对比，返回超出容忍范围的项；compare_time为False时只对比内存峰值
+def compare_baseline(results, baseline, tolerance, compare_time=True):
+    previous = {item["name"]: item for item in baseline["results"]}
+    keys = METRIC_KEYS if compare_time else ("peak_mb",)
+    regressions = []
+    for result in results:
+        old = previous.get(result["name"])
+        if old is None:
+            continue
+        for key in keys:
+            if old[key] and result[key] > old[key] * (1 + tolerance):
+                regressions.append(f"{result['name']}.{key}: {old[key]} -> {result[key]}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="使用模拟模型接口离线测试流水线、解析、去重和导出的性能")
+    parser.add_argument("--corpus", default="", help="需求文档所在目录，默认按small/medium/large生成")
+    parser.add_argument("--repeat", type=int, default=3, help="每个需求文档执行流水线的次数")
+    parser.add_argument("-c", "--concurrency", type=int, default=4, help="同时执行的流水线数量")
+    parser.add_argument("--section-tokens", type=int, default=0, help="大于0时按章节分段并行生成")
+    parser.add_argument("--rounds", type=int, default=5, help="解析、去重和导出的重复次数")
+    parser.add_argument("--cases", type=int, default=SYNTHETIC_CASES, help="去重和导出额外使用的合成用例数")
+    parser.add_argument("--dedupe-threshold", type=float, default=DEFAULT_THRESHOLD, help="近似重复用例的相似度阈值")
+    parser.add_argument("--latency", type=float, default=0.05, help="模拟接口首个token前的等待时间（秒）")
+    parser.add_argument("--token-rate", type=float, default=0, help="模拟接口每秒输出的token数，0表示不限")
+    parser.add_argument("--approve-after", type=int, default=2, help="编写用例模型发言几次后评审通过")
+    parser.add_argument("--base-url", default="", help="使用已启动的模拟接口，不再自动启动")
+    parser.add_argument("--model", default="deepseek", help="使用的模型配置名")
+    parser.add_argument("--no-memory", action="store_true", help="不统计内存峰值（tracemalloc会明显拖慢执行）")
+    parser.add_argument("-o", "--output", default="", help="结果保存为json文件")
+    parser.add_argument("--baseline", default="", help="与之对比的基线结果（--output保存的json）")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="相对基线允许的增幅")
+    args = parser.parse_args()
+
+    process = None
+    base_url = args.base_url
+    if not base_url:
+        port = free_port()
+        process = start_mock(port, ["--latency", str(args.latency), "--token-rate", str(args.token_rate),
+                                    "--approve-after", str(args.approve_after)])
+        base_url = f"http://127.0.0.1:{port}/v1"
+    gen_role = mock_role("gen_cases_model_config.json", "gen_cases_model_prompt.txt", args.model, base_url)
+    review_role = mock_role("review_cases_model_config.json", "review_cases_model_prompt.txt", args.model, base_url)
+
+    corpus = load_corpus(args.corpus)
+    if not args.no_memory:
+        tracemalloc.start()
+    try:
+        pipeline_result, runs = bench_pipeline(corpus, gen_role, review_role, args.repeat, args.concurrency,
+                                               args.section_tokens)
+    finally:
+        close_all()
+        if process is not None:
+            process.terminate()
+            process.wait()
+    case_lists = [run["case_list"] for run in runs if run["case_list"]] + [synthetic_cases(args.cases)]
+    results = [
+        pipeline_result,
+        bench_parsing([run["response"] for run in runs], args.rounds),
+        bench_dedupe(case_lists, args.dedupe_threshold, args.rounds),
+        bench_export(case_lists, args.rounds),
+    ]
+    tracemalloc.stop()
+    print_report(results)
+
+    report = {"created": time.strftime("%Y-%m-%d %H:%M:%S"), "corpus": [item["id"] for item in corpus],
+              "args": vars(args), "results": results}
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=4)
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        # tracemalloc会拖慢执行，开关不同的两次结果耗时不可比
+        compare_time = baseline["args"].get("no_memory") == args.no_memory
+        if not compare_time:
+            print("基线与本次的内存统计设置不同，只对比内存峰值")
+        regressions = compare_baseline(results, baseline, args.tolerance, compare_time)
+        if regressions:
+            print("性能回退：\n" + "\n".join(regressions))
+            return 1
+        print("与基线相比没有性能回退")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,229 @@
+import argparse
+import hashlib
+import json
+import re
+import sys
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# 离线基准测试用的OpenAI兼容接口（/v1/chat/completions），不依赖网络和真实模型，输出完全由请求内容决定：
+# 系统提示词中含review_marker的是评审模型，对话中已有approve_after份用例表格时回复APPROVE，否则要求补充；
+# 含“打分”的是多模型并行生成的评分请求；含“缺漏的测试点”的是人工测试用例对照请求；带图片的是文档解析请求；其余为编写用例模型，
+# 按需求长度（或任务中的“最多生成n条”）输出用例表格，其中duplicate_ratio比例的用例是前面用例的近似重复，供去重使用。
+# 首个token前等待latency秒，之后按token_rate（每秒token数，0表示不限）输出；
+# script为jsonl文件时按 {"role": "gen"/"review", "content": "..."} 依次回复脚本中的内容（按对话轮次循环）
+HEADER = "| 用例ID | 用例标题 | 测试目标 | 前置条件 | 操作步骤 | 预期结果 | 优先级 | 测试类型 |"
+SEPARATOR = "|--------|--------|--------|--------|--------|--------|--------|--------|"
+# 每多少字需求对应一条用例
+CHARS_PER_CASE = 150
+MIN_CASES = 3
+MAX_CASES = 60
+# 流式输出时每个片段的token数
+STREAM_CHUNK_TOKENS = 4
+MAX_CASES_PATTERN = re.compile(r'最多生成(\d+)条')
+DEFAULT_OPTIONS = {
+    "latency": 0.2,
+    "token_rate": 0,
+    "approve_after": 2,
+    "duplicate_ratio": 0.1,
+    "review_marker": "项目经理",
+    "script": None,
+}
+
+
+def estimate_tokens(text):
+    return max(1, len(text) // 2)
+
+
+def message_text(message):
+    content = message.get("content") or ""
+    if isinstance(content, list):
+        return "".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return content
+
+
+def has_image(message):
+    content = message.get("content")
+    return isinstance(content, list) and any(part.get("type") == "image_url" for part in content)
+
+
+def case_row(module, index, topic):
+    return (f"| {module}_{index:03d} | 验证功能点{topic}的处理 | 确认功能点{topic}符合需求 | 已登录系统 | "
+            f"1. 打开功能点{topic}页面<br>2. 输入数据并提交 | 功能点{topic}处理成功并给出提示 | "
+            f"P{index % 4} | {'功能' if index % 3 else '异常'} |")
+
+
+def gen_cases(task, round_no, duplicate_ratio):
+    seed = int(hashlib.md5(task.encode("utf-8")).hexdigest()[:8], 16)
+    module = f"模块{seed % 97}"
+    count = min(MAX_CASES, max(MIN_CASES, len(task) // CHARS_PER_CASE))
+    match = MAX_CASES_PATTERN.search(task)
+    if match and int(match.group(1)) > 0:
+        count = min(count, int(match.group(1)))
+    # 修改后的版本比上一轮多一条用例
+    count += round_no - 1
+    duplicate_every = round(1 / duplicate_ratio) if duplicate_ratio > 0 else 0
+    rows = [HEADER, SEPARATOR]
+    for i in range(1, count + 1):
+        topic = (seed + i) % 1000
+        if duplicate_every and i > 1 and i % duplicate_every == 0:
+            topic = (seed + i - 1) % 1000
+        rows.append(case_row(module, i, topic))
+    return f"根据需求编写的测试用例如下（第{round_no}版）：\n\n" + "\n".join(rows) + "\n\n以上用例覆盖了主要功能路径和异常场景。"
+
+
+class MockLLM:
+    def __init__(self, options=None):
+        self.options = {**DEFAULT_OPTIONS, **(options or {})}
+        self.scripts = {"gen": [], "review": []}
+        if self.options["script"]:
+            with open(self.options["script"], 'r', encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        item = json.loads(line)
+                        self.scripts[item["role"]].append(item["content"])
+
+    def reply(self, messages):
+        system = message_text(messages[0]) if messages and messages[0].get("role") == "system" else ""
+        history = [message_text(message) for message in messages if message.get("role") != "system"]
+        # 对话中已有的用例表格数（含压缩历史后的表格摘要），即编写用例模型已经发言的轮数
+        tables = sum(1 for text in history if "| 用例ID |" in text or "用例表格已省略" in text)
+        if any(has_image(message) for message in messages):
+            return "图片为功能页面截图，包含输入框、提交按钮和结果提示区域。"
+        if "打分" in system:
+            return "85"
+        # 人工测试用例对照：每一批列出两个缺漏的测试点
+        if "缺漏的测试点" in system:
+            seed = int(hashlib.md5(system.encode("utf-8")).hexdigest()[:8], 16)
+            return "\n".join(f"- 人工用例中的测试点{(seed + i) % 1000}" for i in range(2))
+        if self.options["review_marker"] in system:
+            if self.scripts["review"]:
+                return self.scripts["review"][(tables - 1) % len(self.scripts["review"])]
+            if tables >= self.options["approve_after"]:
+                return "用例已覆盖主要功能和异常场景，评审通过。APPROVE"
+            return "评审意见：请补充边界条件和异常场景的用例。"
+        round_no = tables + 1
+        if self.scripts["gen"]:
+            return self.scripts["gen"][(round_no - 1) % len(self.scripts["gen"])]
+        task = history[0] if history else ""
+        return gen_cases(task, round_no, self.options["duplicate_ratio"])
+
+    # 按token_rate输出text所需的时间
+    def token_delay(self, tokens):
+        rate = self.options["token_rate"]
+        return tokens / rate if rate else 0
+
+
+def completion_chunk(model, delta, finish_reason=None, usage=None):
+    chunk = {"id": "mock", "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+             "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+    if usage is not None:
+        chunk["usage"] = usage
+    return chunk
+
+
+def create_handler(mock):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _send_json(self, data, status=200):
+            body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        # 流式输出用分块传输编码，连接保持可复用，与真实接口一样可以测到连接池的效果
+        def _write_chunk(self, data):
+            self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+
+        def do_GET(self):
+            if self.path.rstrip("/").endswith("/models"):
+                self._send_json({"object": "list", "data": [{"id": "mock", "object": "model"}]})
+            else:
+                self._send_json({"error": {"message": "not found"}}, 404)
+
+        def do_POST(self):
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self._send_json({"error": {"message": "not found"}}, 404)
+                return
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            messages = body.get("messages", [])
+            text = mock.reply(messages)
+            usage = {"prompt_tokens": sum(estimate_tokens(message_text(m)) for m in messages),
+                     "completion_tokens": estimate_tokens(text)}
+            usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+            model = body.get("model", "mock")
+            time.sleep(mock.options["latency"])
+            if not body.get("stream"):
+                time.sleep(mock.token_delay(usage["completion_tokens"]))
+                self._send_json({"id": "mock", "object": "chat.completion", "created": int(time.time()), "model": model,
+                                 "choices": [{"index": 0, "message": {"role": "assistant", "content": text},
+                                              "finish_reason": "stop"}],
+                                 "usage": usage})
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            step = STREAM_CHUNK_TOKENS * 2
+            chunks = [completion_chunk(model, {"role": "assistant", "content": ""})]
+            chunks += [completion_chunk(model, {"content": text[i:i + step]}) for i in range(0, len(text), step)]
+            chunks.append(completion_chunk(model, {}, "stop"))
+            if (body.get("stream_options") or {}).get("include_usage"):
+                chunks.append({**completion_chunk(model, {}, usage=usage), "choices": []})
+            try:
+                for index, chunk in enumerate(chunks):
+                    if 0 < index < len(chunks) - 1:
+                        time.sleep(mock.token_delay(STREAM_CHUNK_TOKENS))
+                    self._write_chunk(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+                self._write_chunk(b"data: [DONE]\n\n")
+                self._write_chunk(b"")
+            except (BrokenPipeError, ConnectionResetError):
+                self.close_connection = True
+
+    return Handler
+
+
+def create_server(host="127.0.0.1", port=0, options=None):
+    server = ThreadingHTTPServer((host, port), create_handler(MockLLM(options)))
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="离线基准测试用的OpenAI兼容模拟接口")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址")
+    parser.add_argument("--port", type=int, default=18080, help="监听端口")
+    parser.add_argument("--latency", type=float, default=DEFAULT_OPTIONS["latency"], help="首个token前的等待时间（秒）")
+    parser.add_argument("--token-rate", type=float, default=DEFAULT_OPTIONS["token_rate"],
+                        help="每秒输出的token数，0表示不限")
+    parser.add_argument("--approve-after", type=int, default=DEFAULT_OPTIONS["approve_after"],
+                        help="编写用例模型发言几次后评审模型回复APPROVE")
+    parser.add_argument("--duplicate-ratio", type=float, default=DEFAULT_OPTIONS["duplicate_ratio"],
+                        help="生成的用例中近似重复用例的比例")
+    parser.add_argument("--review-marker", default=DEFAULT_OPTIONS["review_marker"],
+                        help="系统提示词中含有此文字的请求视为评审模型")
+    parser.add_argument("--script", default=None, help="按顺序回复的脚本（jsonl）")
+    args = parser.parse_args()
+
+    server = create_server(args.host, args.port, {
+        "latency": args.latency, "token_rate": args.token_rate, "approve_after": args.approve_after,
+        "duplicate_ratio": args.duplicate_ratio, "review_marker": args.review_marker, "script": args.script,
+    })
+    print(f"模拟模型接口：http://{args.host}:{server.server_address[1]}/v1", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+import re
+
+
+# 匹配模型输出中的markdown表格行，例如：| 用例ID | 用例标题 | ... |
+CASE_ROW_PATTERN = re.compile(r'(\|.+\|)', re.IGNORECASE)
+# 表格的分隔行，例如：|--------|:------:|
+SEPARATOR_CELL_PATTERN = re.compile(r'^:?-+:?$')
+# 单元格之间的竖线，markdown中转义的“\|”属于单元格内容
+CELL_SPLIT_PATTERN = re.compile(r'(?<!\\)\|')
+# 用例ID的格式为[模块]_[序号]
+CASE_ID_PATTERN = re.compile(r'^(.*?)[_\-]?(\d+)$')
+# 编写用例提示词（gen_cases_model_prompt.txt）中约定的表格列
+CASE_COLUMNS = ["用例ID", "用例标题", "测试目标", "前置条件", "操作步骤", "预期结果", "优先级", "测试类型"]
+
+
+# 从模型的原始输出中提取测试用例表格行，并去掉完全重复的行（保持原有顺序）
+def format_testcases(raw_output):
+    cases = CASE_ROW_PATTERN.findall(raw_output)
+    return list(dict.fromkeys(cases))
+
+
+# 拆分表格行的各个单元格
+def split_case_row(row):
+    return [cell.strip() for cell in CELL_SPLIT_PATTERN.split(row.strip().strip("|"))]
+
+
+def is_separator_row(row):
+    cells = split_case_row(row)
+    return all(SEPARATOR_CELL_PATTERN.match(cell) for cell in cells if cell)
+
+
+def is_header_row(row):
+    return split_case_row(row)[0] == CASE_COLUMNS[0]
+
+
+# 只保留用例数据行，去掉表头和分隔行
+def data_rows(case_list):
+    return [row for row in case_list if not is_separator_row(row) and not is_header_row(row)]
+
+
+def join_case_row(cells):
+    return "| " + " | ".join(cells) + " |"
+
+
+def case_module(match):
+    module = match.group(1).rstrip("_-") if match else ""
+    return module or "TC"
+
+
+# 每个模块已用到的最大序号，作为renumber_case_ids的start可以接着编号
+def case_id_counters(case_list):
+    counters = {}
+    for row in data_rows(case_list):
+        match = CASE_ID_PATTERN.match(split_case_row(row)[0])
+        module = case_module(match)
+        counters[module] = max(counters.get(module, 0), int(match.group(2)) if match else 0)
+    return counters
+
+
+# 重新编号用例ID：保留原ID中的模块名，序号按出现顺序在每个模块内连续递增，
+# 同样的输入总是得到同样的编号，合并多段结果后ID全局唯一
+def renumber_case_ids(rows, start=None):
+    counters = dict(start or {})
+    renumbered = []
+    for row in rows:
+        cells = split_case_row(row)
+        match = CASE_ID_PATTERN.match(cells[0])
+        module = case_module(match)
+        counters[module] = counters.get(module, 0) + 1
+        cells[0] = f"{module}_{counters[module]:03d}"
+        renumbered.append(join_case_row(cells))
+    return renumbered
+
+
+# 合并多段生成的用例：只保留一个表头，去掉除用例ID外内容完全相同的行，并重新编号
+def merge_testcases(case_lists):
+    seen = set()
+    rows = []
+    for case_list in case_lists:
+        for row in data_rows(case_list):
+            key = tuple(split_case_row(row)[1:])
+            if key not in seen:
+                seen.add(key)
+                rows.append(row)
+    if not rows:
+        return []
+    header = [join_case_row(CASE_COLUMNS), join_case_row(["--------"] * len(CASE_COLUMNS))]
+    return header + renumber_case_ids(rows)
+
+
+# 追加新用例：已有用例及其ID保持不变，内容（不含用例ID）重复的新用例丢弃，其余接着各模块的序号编号
+def append_testcases(case_list, new_rows):
+    seen = {tuple(split_case_row(row)[1:]) for row in data_rows(case_list)}
+    rows = []
+    for row in data_rows(new_rows):
+        key = tuple(split_case_row(row)[1:])
+        if key not in seen:
+            seen.add(key)
+            rows.append(row)
+    if not rows:
+        return list(case_list)
+    if not case_list:
+        return merge_testcases([rows])
+    return list(case_list) + renumber_case_ids(rows, start=case_id_counters(case_list))
+
+
+# 将测试用例表格行拼接为markdown文本
+def cases_to_markdown(case_list):
+    return "\n".join(case_list)
+
@@ -0,0 +1,117 @@
+import re
+import tiktoken
+
+
+# 长需求文档的切分：先按标题切成章节，再按token数把相邻的小章节合并、把过大的章节拆开，
+# 每一段单独生成用例，避免整篇文档超出模型的max_tokens限制导致用例被截断
+
+# 计算token时使用的编码，deepseek等模型没有公开的tiktoken编码，用cl100k_base估算即可
+TOKEN_ENCODING = "cl100k_base"
+# 每段默认的最大token数
+DEFAULT_SECTION_TOKENS = 1500
+
+# 标题行：markdown标题、“一、”、“第一章/第1节”、“1.2 ”等多级编号
+HEADING_PATTERN = re.compile(
+    r'^\s*(#{1,6}\s+\S.*'
+    r'|[一二三四五六七八九十百]+[、.．]\s*\S.*'
+    r'|第[一二三四五六七八九十百\d]+[章节部分篇]\s*.*'
+    r'|\d+(\.\d+)+\.?\s+\S.*)$'
+)
+# “1、”“1.”形式的编号既可能是标题也可能是操作步骤，只有较短、不以句末标点结尾且后面紧跟正文的行才视为标题，
+# 后面是另一个编号或标题的（如连续的操作步骤）是列表项
+SHORT_HEADING_PATTERN = re.compile(r'^\s*\d+[、.．]\s*\S.{0,28}$')
+SENTENCE_END = ("。", "；", ";", "：", ":", "，", ",")
+
+_encoding = None
+
+
+def count_tokens(text):
+    global _encoding
+    if _encoding is None:
+        try:
+            _encoding = tiktoken.get_encoding(TOKEN_ENCODING)
+        except Exception:
+            # 编码文件无法下载（如离线环境）时，按字符数粗略估算；只尝试一次，避免每次计数都重新下载
+            _encoding = False
+    if _encoding is False:
+        return len(text)
+    return len(_encoding.encode(text, disallowed_special=()))
+
+
+def _is_short_heading(line):
+    return bool(SHORT_HEADING_PATTERN.match(line)) and not line.rstrip().endswith(SENTENCE_END)
+
+
+# next_line为下一个非空行（没有时为None），用于区分编号标题和编号列表项
+def is_heading(line, next_line=None):
+    if HEADING_PATTERN.match(line):
+        return True
+    return (_is_short_heading(line) and next_line is not None and not HEADING_PATTERN.match(next_line)
+            and not _is_short_heading(next_line))
+
+
+# 按标题把需求文档切成章节：[{"title": 标题, "content": 章节全文（含标题行）}]
+# 连续的多级标题之间没有正文时归入同一章节，标题取最后一级
+def split_prd_sections(prd):
+    sections = []
+    title = ""
+    lines = []
+    has_body = False
+    prd_lines = prd.splitlines()
+    next_lines = [None] * len(prd_lines)
+    next_line = None
+    for i in range(len(prd_lines) - 1, -1, -1):
+        next_lines[i] = next_line
+        if prd_lines[i].strip():
+            next_line = prd_lines[i]
+    for line, next_line in zip(prd_lines, next_lines):
+        if is_heading(line, next_line):
+            if has_body:
+                sections.append({"title": title, "content": "\n".join(lines).strip()})
+                lines = []
+                has_body = False
+            title = line.strip().lstrip("#").strip()
+        elif line.strip():
+            has_body = True
+        lines.append(line)
+    if any(x.strip() for x in lines):
+        sections.append({"title": title, "content": "\n".join(lines).strip()})
+    return sections
+
+
+# 把超过token上限的章节按行拆开
+def _split_large_section(section, max_tokens):
+    parts = []
+    lines = []
+    size = 0
+    for line in section["content"].splitlines():
+        line_tokens = count_tokens(line) + 1
+        if lines and size + line_tokens > max_tokens:
+            parts.append("\n".join(lines))
+            lines = []
+            size = 0
+        lines.append(line)
+        size += line_tokens
+    if lines:
+        parts.append("\n".join(lines))
+    if len(parts) == 1:
+        return [section]
+    return [{"title": f"{section['title']}（{i}/{len(parts)}）", "content": part}
+            for i, part in enumerate(parts, start=1)]
+
+
+# 将需求文档切成不超过max_tokens的若干段，每段带有token数，便于按比例分配用例数量
+def chunk_prd(prd, max_tokens=DEFAULT_SECTION_TOKENS):
+    chunks = []
+    for section in split_prd_sections(prd):
+        for part in _split_large_section(section, max_tokens):
+            tokens = count_tokens(part["content"])
+            # 相邻的小章节合并到同一段，减少对话组数量
+            if chunks and chunks[-1]["tokens"] + tokens <= max_tokens:
+                last = chunks[-1]
+                last["title"] = f"{last['title']}；{part['title']}" if last["title"] else part["title"]
+                last["content"] = f"{last['content']}\n\n{part['content']}"
+                last["tokens"] += tokens
+            else:
+                chunks.append({"title": part["title"], "content": part["content"], "tokens": tokens})
+    return chunks
@@ -0,0 +1,140 @@
+import asyncio
+import threading
+from autogen_core.models import ChatCompletionClient
+from autogen_ext.models.openai import OpenAIChatCompletionClient
+
+
+# 进程内共用的模型客户端。
+# 每次运行都新建客户端并用asyncio.run新开事件循环时，HTTP连接和TLS握手无法复用；
+# 这里在后台线程中常驻一个事件循环，页面和命令行都通过run_coroutine把任务交给它执行，
+# 同一个(接口地址, api_key, 模型)在这个循环上只创建一个客户端，各次运行、各个会话共用其连接池。
+# 同一接口地址（模型厂商）的并发请求数由信号量限制，可以在模型配置中用max_concurrency设置，
+# 修改后从下一次请求开始生效（已在等待或执行中的请求仍按原来的限制）
+DEFAULT_PROVIDER_CONCURRENCY = 8
+
+_lock = threading.Lock()
+_loop = None
+_clients = {}
+_semaphores = {}
+
+
+def get_loop():
+    global _loop
+    with _lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="client-pool-loop", daemon=True).start()
+        return _loop
+
+
+def on_pool_loop():
+    try:
+        return asyncio.get_running_loop() is _loop
+    except RuntimeError:
+        return False
+
+
+# 在后台事件循环中执行协程并等待结果，代替asyncio.run
+def run_coroutine(coro):
+    future = asyncio.run_coroutine_threadsafe(coro, get_loop())
+    try:
+        return future.result()
+    except BaseException:
+        # 调用方被中断时，一并取消后台的任务
+        future.cancel()
+        raise
+
+
+# 在其他事件循环（如serve.py的HTTP服务）中等待后台事件循环执行协程，取消等待时一并取消后台的任务
+async def run_on_pool(coro):
+    return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, get_loop()))
+
+
+# 限制同一模型厂商的并发请求数；共用的客户端不随单次运行关闭，见close_all
+class LimitedClient(ChatCompletionClient):
+    def __init__(self, client, semaphore):
+        self._client = client
+        self._semaphore = semaphore
+
+    async def create(self, *args, **kwargs):
+        async with self._semaphore:
+            return await self._client.create(*args, **kwargs)
+
+    async def create_stream(self, *args, **kwargs):
+        async with self._semaphore:
+            async for chunk in self._client.create_stream(*args, **kwargs):
+                yield chunk
+
+    async def close(self):
+        pass
+
+    def actual_usage(self):
+        return self._client.actual_usage()
+
+    def total_usage(self):
+        return self._client.total_usage()
+
+    def count_tokens(self, messages, **kwargs):
+        return self._client.count_tokens(messages, **kwargs)
+
+    def remaining_tokens(self, messages, **kwargs):
+        return self._client.remaining_tokens(messages, **kwargs)
+
+    @property
+    def capabilities(self):
+        return self._client.capabilities
+
+    @property
+    def model_info(self):
+        return self._client.model_info
+
+
+def _new_client(conf, stream=False):
+    kwargs = {"stream_options": {"include_usage": True}} if stream else {}
+    return OpenAIChatCompletionClient(
+        model=conf['model'],
+        base_url=conf['base_url'],
+        api_key=conf['api_key'],
+        model_info=conf["model_info"],
+        **kwargs,
+    )
+
+
+# 接口地址的信号量：{接口地址: (并发数, 信号量)}，配置中的并发数变化时换成新的信号量
+def provider_semaphore(conf):
+    limit = conf.get("max_concurrency", DEFAULT_PROVIDER_CONCURRENCY)
+    current = _semaphores.get(conf['base_url'])
+    if current is None or current[0] != limit:
+        current = (limit, asyncio.Semaphore(limit))
+        _semaphores[conf['base_url']] = current
+    return current[1]
+
+
+# 取得共用的客户端，只能在后台事件循环中使用（客户端的连接池绑定在创建它的事件循环上）
+def pooled_client(conf, stream=False):
+    key = (conf['base_url'], conf['api_key'], conf['model'], stream)
+    semaphore = provider_semaphore(conf)
+    client = _clients.get(key)
+    if client is None:
+        client = LimitedClient(_new_client(conf, stream), semaphore)
+        _clients[key] = client
+    else:
+        client._semaphore = semaphore
+    return client
+
+
+# 后台事件循环之外（如单独调用asyncio.run）时创建独立的客户端，用完由调用方关闭
+def get_client(conf, stream=False):
+    return pooled_client(conf, stream) if on_pool_loop() else _new_client(conf, stream)
+
+
+# 关闭所有共用的客户端，进程退出前调用
+def close_all():
+    async def close():
+        clients = list(_clients.values())
+        _clients.clear()
+        for client in clients:
+            await client._client.close()
+
+    if _loop is not None:
+        run_coroutine(close())
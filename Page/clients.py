@@ -0,0 +1,31 @@
+import time
+from autogen_core.models import SystemMessage, UserMessage
+from client_pool import get_client
+from llm_cache import cached_client
+
+
+# 创建补全式的对话客户端，use_cache为True时相同的请求直接返回缓存中的回复，
+# stream为True时要求接口在流式输出的最后返回token用量；
+# 在后台事件循环（client_pool.run_coroutine）中调用时返回共用的客户端
+def create_model_client(model_config, model_select, use_cache=False, stream=False):
+    conf = model_config[model_select]
+    model_client = get_client(conf, stream)
+    if use_cache:
+        model_client = cached_client(model_client, conf)
+    return model_client
+
+
+# 不经过对话组，用角色的系统提示词单次调用模型，返回回复的文本；
+# metrics不为空时按返回的usage记为agent的一轮
+async def complete(role, content, metrics=None, agent="user"):
+    model_client = create_model_client(role["config"], role["model_select"], role.get("use_cache", False))
+    started = time.perf_counter()
+    try:
+        result = await model_client.create([SystemMessage(content=role["prompt"]),
+                                            UserMessage(content=content, source="user")])
+    finally:
+        await model_client.close()
+    if metrics is not None:
+        metrics.record(agent, result.usage.prompt_tokens, result.usage.completion_tokens,
+                       time.perf_counter() - started, cached=result.cached)
+    return result.content if isinstance(result.content, str) else str(result.content)
@@ -0,0 +1,69 @@
+from autogen_core.model_context import UnboundedChatCompletionContext
+from cases import data_rows, split_case_row
+from termination import GEN_SOURCE
+
+
+# 评审轮次之间压缩对话历史。
+# RoundRobinGroupChat每一轮都把完整的历史（需求文档、每一版用例表格、评审意见）重新发给模型，输入token随轮数平方增长；
+# 这里只保留编写用例模型最新一版的完整表格，之前各版的表格替换为一行摘要（用例数和与下一版相比的增删改数），
+# 表格以外的说明文字和评审意见原样保留。
+# 系统提示词和第一条消息（需求文档）不做任何改动，每一版的摘要只取决于这一版和下一版的内容，
+# 已经压缩过的历史在之后的轮次中保持逐字节相同，模型厂商的前缀缓存（prompt caching）可以命中
+TABLE_SUMMARY = "（第{version}版用例表格已省略：共{count}条用例；第{next}版新增{added}条、删除{removed}条、修改{changed}条）"
+
+
+def is_table_line(line):
+    line = line.strip()
+    return len(line) > 1 and line.startswith("|") and line.endswith("|")
+
+
+# 消息中的用例：{用例ID: 其余各列}
+def case_table(content):
+    rows = data_rows([line.strip() for line in content.split("\n") if is_table_line(line)])
+    table = {}
+    for row in rows:
+        cells = split_case_row(row)
+        table[cells[0]] = tuple(cells[1:])
+    return table
+
+
+# 把消息中的表格替换为summary，多个表格时只保留一行摘要
+def replace_tables(content, summary):
+    lines = []
+    replaced = False
+    for line in content.split("\n"):
+        if not is_table_line(line):
+            lines.append(line)
+        elif not replaced:
+            lines.append(summary)
+            replaced = True
+    return "\n".join(lines)
+
+
+def table_summary(version, table, next_table):
+    return TABLE_SUMMARY.format(
+        version=version, count=len(table), next=version + 1,
+        added=sum(1 for case_id in next_table if case_id not in table),
+        removed=sum(1 for case_id in table if case_id not in next_table),
+        changed=sum(1 for case_id, cells in next_table.items() if case_id in table and table[case_id] != cells),
+    )
+
+
+class CompactedChatContext(UnboundedChatCompletionContext):
+    async def get_messages(self):
+        messages = await super().get_messages()
+        # 编写用例模型输出的各版用例表格（第一条消息是任务，不参与压缩）
+        versions = []
+        for index, message in enumerate(messages[1:], start=1):
+            if getattr(message, "source", None) == GEN_SOURCE and isinstance(message.content, str):
+                table = case_table(message.content)
+                if table:
+                    versions.append((index, table))
+        if len(versions) < 2:
+            return messages
+        compacted = list(messages)
+        for version, ((index, table), (_, next_table)) in enumerate(zip(versions, versions[1:]), start=1):
+            summary = table_summary(version, table, next_table)
+            compacted[index] = messages[index].model_copy(
+                update={"content": replace_tables(messages[index].content, summary)})
+        return compacted
@@ -0,0 +1,74 @@
+import copy
+import json
+import os
+import tempfile
+import threading
+
+
+# 模型配置和提示词模板的读写。
+# 页面每次交互都会重新运行脚本，这里按文件路径缓存解析结果，同一进程内的所有会话共用，
+# 只有文件的修改时间或大小变化时才重新读取；写入时先写临时文件再替换，并发保存不会产生写了一半的json
+_lock = threading.RLock()
+# 绝对路径 -> ((修改时间, 文件大小), 解析结果)
+_cache = {}
+
+
+def _signature(path):
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _load(path, parse):
+    path = os.path.abspath(path)
+    signature = _signature(path)
+    with _lock:
+        cached = _cache.get(path)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+        with open(path, 'r', encoding='utf-8') as f:
+            value = parse(f.read())
+        _cache[path] = (signature, value)
+        return value
+
+
+# 返回的是副本，调用方修改后不会影响缓存和其他会话
+def load_json(path):
+    return copy.deepcopy(_load(path, json.loads))
+
+
+def load_text(path):
+    return _load(path, str)
+
+
+def _write(path, content):
+    path = os.path.abspath(path)
+    with _lock:
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(content)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        _cache.pop(path, None)
+
+
+def write_json(path, data):
+    _write(path, json.dumps(data, indent=4))
+
+
+def write_text(path, text):
+    _write(path, text)
+
+
+# 读取最新的json，交给update修改后写回；整个过程持有锁，多人同时保存不同模型的配置时不会互相覆盖
+def update_json(path, update):
+    with _lock:
+        data = load_json(path)
+        update(data)
+        write_json(path, data)
+        return data
@@ -0,0 +1,164 @@
+import re
+import zlib
+import numpy as np
+from cases import split_case_row, is_header_row, is_separator_row
+
+
+# 近似重复用例去重：多轮评审、分段生成后常出现换了说法但内容相同的用例。
+# 做法：规范化用例内容 -> 字符n-gram -> MinHash签名 -> LSH分桶找候选对 -> 精确Jaccard确认 -> 并查集聚类，
+# 每一类只保留内容最完整的一条。全部在本地完成，不调用模型。
+# 比较前先统一用例中常见的同义说法、去掉虚词，换了说法的用例整体相似度通常在0.45~0.7之间。
+# 正反例、边界值用例（如“用户名为空”和“密码为空”、“长度为1”和“长度为51”）整体内容往往更相似，
+# 所以还要求：用例标题去掉结果词后的主体用字相同（不要求顺序，“手机号格式错误”与“格式错误的手机号”相同）、
+# 标题的正反（是否含否定词）一致、标题和预期结果中的数字相同，宁可漏掉也不误删。
+# 阈值按tests/test_dedup.py中的改写用例和正反例校准
+DEFAULT_THRESHOLD = 0.45
+# 中文词语多为两个字，用字符二元组比三元组更能区分“换了说法”和“不同的用例”
+SHINGLE_SIZE = 2
+NUM_PERM = 128
+# 42个band，每个band 3行，Jaccard约0.3以上的用例对大概率落入同一个桶，再用阈值精确过滤
+NUM_BANDS = 42
+MERSENNE_PRIME = (1 << 31) - 1
+# 参与比较的列：用例标题、测试目标、前置条件、操作步骤、预期结果（不含用例ID、优先级、测试类型）
+CONTENT_COLUMNS = slice(1, 6)
+TITLE_COLUMN = 1
+# 比较数字的列：用例标题、预期结果
+NUMBER_COLUMNS = (1, 5)
+NORMALIZE_PATTERN = re.compile(r'[\s\W_]+', re.UNICODE)
+NUMBER_PATTERN = re.compile(r'\d+(?:\.\d+)?')
+# 同义说法，按顺序替换（长的在前）
+SYNONYMS = (("不正确", "错误"), ("无法", "失败"), ("不能", "失败"), ("不填写", "为空"), ("不填", "为空"),
+            ("留空", "为空"), ("不输入", "为空"), ("填写", "输入"), ("页面", "页"), ("号码", "号"),
+            ("成功登录", "登录成功"))
+FILLER_PATTERN = re.compile(r'使用|通过|按钮|系统|已|的|和|及|与|时|后|并|该')
+# 标题中的结果词和动作词不区分用例的主体
+TITLE_FILLER_PATTERN = re.compile(r'成功|失败|输入|验证(?!码)|校验')
+NEGATIVE_PATTERN = re.compile(r'失败|错误|未|不|无|非法|无效')
+
+_rng = np.random.default_rng(20240501)
+_PERM_A = _rng.integers(1, MERSENNE_PRIME, size=NUM_PERM, dtype=np.uint64)
+_PERM_B = _rng.integers(0, MERSENNE_PRIME, size=NUM_PERM, dtype=np.uint64)
+
+
+def normalize_text(text):
+    text = NORMALIZE_PATTERN.sub("", text.lower())
+    for word, replacement in SYNONYMS:
+        text = text.replace(word, replacement)
+    return FILLER_PATTERN.sub("", text)
+
+
+def normalize_case(cells):
+    return normalize_text("".join(cells[CONTENT_COLUMNS]))
+
+
+# 只有这些都相同的用例才可能重复：(标题主体的用字, 标题是否为反例, 标题和预期结果中出现的数字)
+def case_key(cells):
+    title = normalize_text(cells[TITLE_COLUMN]) if len(cells) > TITLE_COLUMN else ""
+    numbers = tuple(tuple(NUMBER_PATTERN.findall(cells[column] if column < len(cells) else ""))
+                    for column in NUMBER_COLUMNS)
+    return frozenset(TITLE_FILLER_PATTERN.sub("", title)), bool(NEGATIVE_PATTERN.search(title)), numbers
+
+
+def shingles(text, size=SHINGLE_SIZE):
+    if len(text) <= size:
+        return {text} if text else set()
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+def minhash_signature(shingle_set):
+    if not shingle_set:
+        return np.full(NUM_PERM, MERSENNE_PRIME, dtype=np.uint64)
+    hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingle_set), dtype=np.uint64,
+                         count=len(shingle_set)) % MERSENNE_PRIME
+    # (NUM_PERM, k)的矩阵运算一次算出所有排列下的哈希值，再逐行取最小值
+    return ((_PERM_A[:, None] * hashes[None, :] + _PERM_B[:, None]) % MERSENNE_PRIME).min(axis=1)
+
+
+def jaccard(a, b):
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+# 内容越完整越好：非空字段数优先，其次是操作步骤和预期结果的长度
+def completeness(cells):
+    content = cells[CONTENT_COLUMNS]
+    return sum(1 for cell in content if cell), sum(len(cell) for cell in content)
+
+
+# 返回近似重复的用例分组（组内为cells_list中的下标，按出现顺序），只包含两条及以上的组
+def find_duplicate_groups(cells_list, threshold=DEFAULT_THRESHOLD):
+    n = len(cells_list)
+    if n < 2:
+        return []
+    shingle_sets = [shingles(normalize_case(cells)) for cells in cells_list]
+    keys = [case_key(cells) for cells in cells_list]
+    signatures = np.vstack([minhash_signature(s) for s in shingle_sets])
+    rows_per_band = NUM_PERM // NUM_BANDS
+
+    parent = list(range(n))
+
+    def is_duplicate(a, b):
+        return jaccard(shingle_sets[a], shingle_sets[b]) >= threshold
+
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    checked = set()
+    for band in range(NUM_BANDS):
+        buckets = {}
+        band_signatures = signatures[:, band * rows_per_band:(band + 1) * rows_per_band]
+        # 标题主体、正反或数字不同的用例不会是重复的，分桶时带上case_key，模板化的用例不会全部挤进同一个桶
+        for index, key in enumerate(map(bytes, band_signatures)):
+            buckets.setdefault((keys[index], key), []).append(index)
+        for members in buckets.values():
+            for i in range(len(members)):
+                for j in range(i + 1, len(members)):
+                    a, b = members[i], members[j]
+                    if (a, b) in checked:
+                        continue
+                    checked.add((a, b))
+                    if find(a) != find(b) and is_duplicate(a, b):
+                        parent[find(b)] = find(a)
+
+    groups = {}
+    for index in range(n):
+        groups.setdefault(find(index), []).append(index)
+    return [members for members in groups.values() if len(members) > 1]
+
+
+# 只去掉未受保护的用例：与受保护的用例（protected[i]为True）重复的直接去掉，受保护的用例不会被去掉或替换；
+# 只有未受保护用例的组保留内容最完整的一条。rows为用例数据行，返回要去掉的下标集合
+def unprotected_duplicates(rows, protected, threshold=DEFAULT_THRESHOLD):
+    cells_list = [split_case_row(row) for row in rows]
+    removed = set()
+    for group in find_duplicate_groups(cells_list, threshold):
+        if any(protected[i] for i in group):
+            removed.update(i for i in group if not protected[i])
+        else:
+            best = max(group, key=lambda i: (completeness(cells_list[i]), -i))
+            removed.update(i for i in group if i != best)
+    return removed
+
+
+# 对用例表格行去重，表头和分隔行原样保留；返回 (去重后的用例行, 去掉的用例数)。
+# keep大于0时前keep条用例（如增量生成保留下来的用例）不会被去掉或替换，只去掉其后与之重复的用例
+def dedupe_testcases(case_list, threshold=DEFAULT_THRESHOLD, keep=0):
+    data_indexes = [i for i, row in enumerate(case_list) if not is_separator_row(row) and not is_header_row(row)]
+    if keep:
+        removed = {data_indexes[i] for i in unprotected_duplicates(
+            [case_list[i] for i in data_indexes], [i < keep for i in range(len(data_indexes))], threshold)}
+        return [row for i, row in enumerate(case_list) if i not in removed], len(removed)
+    cells_list = [split_case_row(case_list[i]) for i in data_indexes]
+    rows = list(case_list)
+    removed = set()
+    for group in find_duplicate_groups(cells_list, threshold):
+        best = max(group, key=lambda i: (completeness(cells_list[i]), -i))
+        # 保留的用例放在该组第一次出现的位置，保持原有顺序
+        first = group[0]
+        rows[data_indexes[first]] = case_list[data_indexes[best]]
+        removed.update(data_indexes[i] for i in group if i != first)
+    return [row for i, row in enumerate(rows) if i not in removed], len(removed)
@@ -0,0 +1,77 @@
+from io import BytesIO
+import pandas as pd
+import xlsxwriter
+from cases import CASE_COLUMNS, CELL_SPLIT_PATTERN, data_rows, cases_to_markdown
+
+
+# 用例导出：先把表格行一次性解析成固定列（CASE_COLUMNS）的DataFrame，再整体写出xlsx/csv/json，
+# 不再逐个单元格拆分写入，也不会因为表头、分隔行的位置不同导致列错位
+PRIORITIES = ["P0", "P1", "P2", "P3"]
+
+
+def cases_to_frame(case_list):
+    rows = pd.Series(data_rows(case_list), dtype="string")
+    if rows.empty:
+        return pd.DataFrame({column: pd.Series(dtype="string") for column in CASE_COLUMNS})
+    cells = rows.str.strip().str.strip("|").str.split(CELL_SPLIT_PATTERN, expand=True, regex=True)
+    width = len(CASE_COLUMNS)
+    # 单元格内容里出现“|”会多拆出几列，把多出来的部分并回最后一列；列数不足的补空
+    if cells.shape[1] > width:
+        overflow = [cells[column] for column in cells.columns[width:]]
+        cells[width - 1] = cells[width - 1].str.cat(overflow, sep="|", na_rep="").str.rstrip("|")
+        cells = cells.iloc[:, :width]
+    cells = cells.reindex(columns=range(width))
+    cells.columns = CASE_COLUMNS
+    # 导出的单元格中不需要markdown的转义，“\|”还原为“|”
+    frame = cells.astype("string").apply(lambda column: column.str.strip().str.replace("\\|", "|", regex=False))
+    frame = frame.fillna("")
+    # 优先级按P0-P3排序，模型输出的其他写法排在最后，不丢弃
+    priority = frame["优先级"].str.upper()
+    others = sorted(set(priority.unique()) - set(PRIORITIES))
+    frame["优先级"] = pd.Categorical(priority, categories=PRIORITIES + others, ordered=True)
+    return frame.reset_index(drop=True)
+
+
+def _cell_values(frame):
+    return frame.astype("object").where(frame.notna(), "")
+
+
+def frame_to_xlsx(frame, sheet_name="测试用例"):
+    output = BytesIO()
+    # constant_memory模式下每写完一行就落盘，上千条用例时内存占用基本不变，但必须按行顺序写入
+    workbook = xlsxwriter.Workbook(output, {"constant_memory": True})
+    worksheet = workbook.add_worksheet(sheet_name)
+    header_format = workbook.add_format({"bold": True, "bg_color": "#D9E1F2", "border": 1})
+    wrap_format = workbook.add_format({"text_wrap": True, "valign": "top"})
+    worksheet.set_column(0, 0, 14)
+    worksheet.set_column(1, len(CASE_COLUMNS) - 3, 30, wrap_format)
+    worksheet.set_column(len(CASE_COLUMNS) - 2, len(CASE_COLUMNS) - 1, 10)
+    worksheet.write_row(0, 0, list(frame.columns), header_format)
+    for row, values in enumerate(_cell_values(frame).itertuples(index=False, name=None), start=1):
+        worksheet.write_row(row, 0, values)
+    worksheet.freeze_panes(1, 0)
+    workbook.close()
+    return output.getvalue()
+
+
+def frame_to_csv(frame):
+    # 带BOM的utf-8，Excel直接打开不会乱码
+    return frame.to_csv(index=False).encode("utf-8-sig")
+
+
+def frame_to_json(frame):
+    return _cell_values(frame).to_json(orient="records", force_ascii=False, indent=2).encode("utf-8")
+
+
+# 导出格式：扩展名 -> (导出函数, mime类型)
+EXPORT_FORMATS = {
+    "md": (lambda case_list: cases_to_markdown(case_list).encode("utf-8"), "text/markdown"),
+    "xlsx": (lambda case_list: frame_to_xlsx(cases_to_frame(case_list)),
+             "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "csv": (lambda case_list: frame_to_csv(cases_to_frame(case_list)), "text/csv"),
+    "json": (lambda case_list: frame_to_json(cases_to_frame(case_list)), "application/json"),
+}
+
+
+def export_cases(case_list, fmt):
+    return EXPORT_FORMATS[fmt][0](case_list)
@@ -0,0 +1,119 @@
+import asyncio
+import re
+import time
+from clients import complete
+from cases import data_rows, merge_testcases, cases_to_markdown
+from metrics import RunMetrics
+from stream_parser import CaseRowParser
+
+
+# 多模型并行生成：同一个需求同时交给多个编写用例模型，每个模型各自与评审模型进行完整的 生成->评审，
+# 评审模型再给每份结果打分，返回得分最高的一份（best）或按得分顺序合并去重后的全部用例（union）。
+# 每个模型单独限时，响应慢的模型超时后立即停止，只保留超时前已经输出的用例，不会拖慢整体结果。
+DEFAULT_FANOUT_TIMEOUT = 180
+FANOUT_MODES = ("best", "union")
+# 打分调用在指标中的agent名
+SCORE_SOURCE = "score_cases_model"
+
+SCORE_PROMPT = """您是一名资深测试项目经理，请根据需求文档对给定的测试用例打分。
+#评分维度：
+1. 需求覆盖率：是否覆盖需求中的功能点、边界条件和异常场景
+2. 用例完整性：是否包含前置条件、操作步骤和预期结果等必要元素
+3. 可执行性：用例能否直接应用于测试环境
+#输出要求：
+只输出一个0到100之间的整数分数，不要输出其他内容"""
+SCORE_PATTERN = re.compile(r'\d+')
+
+
+# 列出编写用例模型配置中所有可选的模型：[(模型厂商, 模型名)]
+def list_candidates(model_config):
+    return [(model_select, model) for model_select, conf in model_config.items() for model in conf["model_list"]]
+
+
+def candidate_name(candidate):
+    return f"{candidate[0]}:{candidate[1]}"
+
+
+# 解析命令行中的候选模型，如 "deepseek:deepseek-chat,deepseek:deepseek-reasoner"
+def parse_candidates(text):
+    candidates = []
+    for item in text.split(","):
+        if item.strip():
+            model_select, _, model = item.strip().partition(":")
+            candidates.append((model_select, model))
+    return candidates
+
+
+# 用指定的模型替换角色配置中的模型名
+def candidate_role(role, candidate):
+    model_select, model = candidate
+    conf = dict(role["config"][model_select])
+    if model:
+        conf["model"] = model
+    return {**role, "config": {model_select: conf}, "model_select": model_select}
+
+
+# 评审模型给一份用例打分，解析失败时返回None
+async def score_cases(review_role, prd_inputs, case_list, metrics=None):
+    role = {**review_role, "prompt": SCORE_PROMPT}
+    content = f"需求描述：{prd_inputs}\n\n测试用例：\n{cases_to_markdown(case_list)}"
+    reply = await complete(role, content, metrics, SCORE_SOURCE)
+    match = SCORE_PATTERN.search(reply)
+    return min(int(match.group()), 100) if match else None
+
+
+# generate为 生成->评审 的实现（pipeline.gen_review_testcases），每个模型按policy各自评审、修改；
+# 传入metrics时各模型的对话和打分分别统计，结束后按模型顺序合并到metrics中。
+# 返回 (各模型输出的汇总, 最终用例行, 各模型的结果)
+async def gen_fanout(task, prd_inputs, gen_role, review_role, candidates, generate, mode="best",
+                     timeout=DEFAULT_FANOUT_TIMEOUT, on_message=None, on_rows=None, metrics=None, policy=None):
+    candidate_metrics = [RunMetrics(metrics.system_prompts) if metrics is not None else None for _ in candidates]
+
+    async def run_candidate(candidate, run_metrics):
+        outcome = {"model": candidate_name(candidate), "score": None, "cases": 0, "latency": None,
+                   "error": None, "rows": [], "content": ""}
+        started = time.perf_counter()
+
+        def show(content):
+            if on_message is not None:
+                on_message(f"**{outcome['model']}**\n\n{content}")
+
+        try:
+            parser = CaseRowParser(on_rows=on_rows)
+            outcome["content"] = await asyncio.wait_for(
+                generate(task, candidate_role(gen_role, candidate), review_role, on_message=show, parser=parser,
+                         metrics=run_metrics, policy=policy), timeout=timeout or None)
+            outcome["rows"] = parser.rows
+            outcome["cases"] = len(data_rows(parser.rows))
+            outcome["latency"] = round(time.perf_counter() - started, 3)
+            if outcome["cases"]:
+                outcome["score"] = await asyncio.wait_for(
+                    score_cases(review_role, prd_inputs, parser.rows, run_metrics), timeout=timeout or None)
+        except asyncio.TimeoutError:
+            # 超时前已经完整输出的用例仍参与排序
+            outcome["rows"] = parser.rows
+            outcome["cases"] = len(data_rows(parser.rows))
+            outcome["error"] = f"超过{timeout}秒未返回"
+        except Exception as e:
+            outcome["error"] = str(e)
+        return outcome
+
+    outcomes = await asyncio.gather(*(run_candidate(candidate, run_metrics)
+                                      for candidate, run_metrics in zip(candidates, candidate_metrics)))
+    if metrics is not None:
+        for run_metrics in candidate_metrics:
+            metrics.merge(run_metrics)
+        metrics.stop_reason = "; ".join(f"{o['model']}: {o['error'] or run_metrics.stop_reason}"
+                                        for o, run_metrics in zip(outcomes, candidate_metrics))
+        metrics.finish()
+    # 得分高的在前，未能打分的按用例数量排在后面
+    ranked = sorted((o for o in outcomes if o["cases"]),
+                    key=lambda o: (o["score"] is not None, o["score"] or 0, o["cases"]), reverse=True)
+    if not ranked:
+        case_list = []
+    elif mode == "union":
+        case_list = merge_testcases([o["rows"] for o in ranked])
+    else:
+        case_list = merge_testcases([ranked[0]["rows"]])
+    response = "\n\n".join(f"### {o['model']}（得分：{o['score']}）\n{o['content'] or o['error']}" for o in outcomes)
+    return response, case_list, outcomes
@@ -0,0 +1,184 @@
+import hashlib
+import json
+import os
+import re
+import tempfile
+import time
+from cases import CASE_COLUMNS, case_id_counters, data_rows, join_case_row, renumber_case_ids, split_case_row
+from chunking import count_tokens, split_prd_sections
+from dedup import unprotected_duplicates
+
+
+# 增量生成：按文档标识保存上一次的需求文档、各章节的哈希和每个章节生成的用例，
+# 需求修改后按章节对比，只对新增和内容有变化的章节重新 生成->评审，未变化章节的用例及其用例ID原样保留。
+# 重新生成的用例与该章节原有用例内容相同时沿用原来的ID，其余接着各模块用过的最大序号编号，
+# 删除的用例的ID不会被新用例复用。去重时只去掉新生成的用例，保留下来的用例和ID不受影响。
+# 章节的划分与分段生成相同（chunking.split_prd_sections）；第一次增量生成时没有历史记录，所有章节都会生成。
+# 生成的流程见pipeline.gen_review_incremental
+# 注意，当前的工作目录是run.py所在的目录
+INCREMENTAL_DIR = "./Cache/incremental"
+
+UNCHANGED = "unchanged"
+CHANGED = "changed"
+ADDED = "added"
+REMOVED = "removed"
+
+
+def state_path(doc_id, directory=INCREMENTAL_DIR):
+    safe_id = re.sub(r'[^\w\-.]', '_', doc_id)[:80]
+    digest = hashlib.sha1(doc_id.encode("utf-8")).hexdigest()[:8]
+    return os.path.join(directory, f"{safe_id}_{digest}.json")
+
+
+# 上一次的记录（没有时为空记录）：
+# {"doc_id", "updated", "prd", "counters": {模块: 用过的最大序号}, "sections": [{"title", "hash", "rows"}],
+#  "supplement": [人工测试用例对照补充的用例行]}
+# 记录直接读写文件，不经过config_store的缓存，服务长时间运行时每个文档的需求和用例不会一直留在内存中
+def load_state(doc_id, directory=INCREMENTAL_DIR):
+    path = state_path(doc_id, directory)
+    if not os.path.exists(path):
+        return {"doc_id": doc_id, "prd": "", "counters": {}, "sections": [], "supplement": []}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+# 先写临时文件再替换，避免中断时留下写了一半的记录
+def save_state(state, directory=INCREMENTAL_DIR):
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False, indent=4)
+        os.replace(tmp_path, state_path(state["doc_id"], directory))
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+# 章节内容的哈希，忽略行首尾的空白和空行
+def section_hash(content):
+    lines = [line.strip() for line in content.splitlines() if line.strip()]
+    return hashlib.sha1("\n".join(lines).encode("utf-8")).hexdigest()
+
+
+# 新旧章节对比，返回 ([(状态, 新章节, 对应的旧章节)], 删除的旧章节)：
+# 哈希相同的为未变化；哈希不同但标题相同的为有变化；其余为新增
+def diff_sections(old_sections, new_sections):
+    used = set()
+    plan = []
+    for section in new_sections:
+        match = next((i for i, old in enumerate(old_sections) if i not in used and old["hash"] == section["hash"]),
+                     None)
+        if match is not None:
+            used.add(match)
+        plan.append([UNCHANGED if match is not None else None, section,
+                     old_sections[match] if match is not None else None])
+    for item in plan:
+        if item[0] is None:
+            match = next((i for i, old in enumerate(old_sections)
+                          if i not in used and old["title"] == item[1]["title"]), None)
+            if match is not None:
+                used.add(match)
+                item[0], item[2] = CHANGED, old_sections[match]
+            else:
+                item[0] = ADDED
+    removed = [old for i, old in enumerate(old_sections) if i not in used]
+    return [tuple(item) for item in plan], removed
+
+
+def diff_summary(plan, removed):
+    return {
+        UNCHANGED: [section["title"] for status, section, _ in plan if status == UNCHANGED],
+        CHANGED: [section["title"] for status, section, _ in plan if status == CHANGED],
+        ADDED: [section["title"] for status, section, _ in plan if status == ADDED],
+        REMOVED: [old["title"] for old in removed],
+    }
+
+
+def describe_diff(summary):
+    return (f"增量生成：{len(summary[UNCHANGED])}个章节未变化，{len(summary[CHANGED])}个章节有变化，"
+            f"新增{len(summary[ADDED])}个章节，删除{len(summary[REMOVED])}个章节")
+
+
+def _case_key(row):
+    return tuple(split_case_row(row)[1:])
+
+
+# 重新生成的章节的用例与该章节原有用例对照：内容相同的沿用原来的用例行（含ID），与其他用例内容重复的丢弃；
+# 返回 [(用例行, 是否为新用例)]，新用例尚未编号
+def _match_old_rows(rows, old_rows, seen):
+    old_by_key = {_case_key(row): row for row in old_rows}
+    matched = []
+    for row in data_rows(rows):
+        key = _case_key(row)
+        if key in seen:
+            continue
+        seen.add(key)
+        matched.append((old_by_key[key], False) if key in old_by_key else (row, True))
+    return matched
+
+
+# 切分需求文档的章节，每个章节带有在文档中的序号、哈希和token数
+def prepare_sections(prd):
+    sections = split_prd_sections(prd)
+    for position, section in enumerate(sections, start=1):
+        section.update({"position": position, "hash": section_hash(section["content"]),
+                        "tokens": count_tokens(section["content"])})
+    return sections
+
+
+# 按对比结果组装用例：未变化章节的用例原样保留，generated为 {章节序号: 重新生成的用例行}；
+# dedupe_threshold大于0时去掉与其他用例近似重复的新用例，保留下来的用例（含沿用原ID的）不会被去掉或替换，
+# 去重后新用例才接着各模块用过的最大序号编号。
+# 之前人工测试用例对照补充的用例与未变化章节的用例一样保留，放在最后。
+# 返回 (用例行, 新的记录, 去掉的近似重复用例数)，记录由调用方在生成成功后保存
+def build_case_list(doc_id, prd, plan, generated, state, dedupe_threshold=0):
+    # 未变化章节的用例和之前补充的用例先占用其内容和ID，重新生成的用例再去重、编号
+    supplement = state.get("supplement", [])
+    kept_rows = [row for status, _, old in plan if status == UNCHANGED for row in old["rows"]] + supplement
+    seen = {_case_key(row) for row in kept_rows}
+    counters = dict(state["counters"])
+    for module, number in case_id_counters(kept_rows).items():
+        counters[module] = max(counters.get(module, 0), number)
+    section_items = []
+    for status, section, old in plan:
+        if status == UNCHANGED:
+            section_items.append([(row, False) for row in old["rows"]])
+        else:
+            section_items.append(_match_old_rows(generated.get(section["position"], []),
+                                                 old["rows"] if old else [], seen))
+    items = [item for section_rows in section_items for item in section_rows] + [(row, False) for row in supplement]
+    removed = set()
+    if dedupe_threshold:
+        removed = unprotected_duplicates([row for row, _ in items], [not is_new for _, is_new in items],
+                                         dedupe_threshold)
+    sections = []
+    rows = []
+    index = 0
+    for (status, section, old), section_rows in zip(plan, section_items):
+        numbered = []
+        for row, is_new in section_rows:
+            if index not in removed:
+                if is_new:
+                    row = renumber_case_ids([row], start=counters)[0]
+                    counters.update(case_id_counters([row]))
+                numbered.append(row)
+            index += 1
+        sections.append({"title": section["title"], "hash": section["hash"], "rows": numbered})
+        rows.extend(numbered)
+    rows.extend(supplement)
+    for module, number in case_id_counters(rows).items():
+        counters[module] = max(counters.get(module, 0), number)
+    case_list = [join_case_row(CASE_COLUMNS), join_case_row(["--------"] * len(CASE_COLUMNS))] + rows if rows else []
+    return case_list, {"doc_id": doc_id, "updated": time.time(), "prd": prd, "counters": counters,
+                       "sections": sections, "supplement": list(supplement)}, len(removed)
+
+
+# 记录人工测试用例对照补充的用例：接着记录中各模块用过的最大序号重新编号（删除的用例的ID同样不会被复用），
+# 返回编号后的用例行，state会被更新
+def add_supplement_rows(state, rows):
+    rows = renumber_case_ids(data_rows(rows), start=state["counters"])
+    state["supplement"] = state.get("supplement", []) + rows
+    state["counters"].update(case_id_counters(rows))
+    return rows
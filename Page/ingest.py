@@ -0,0 +1,146 @@
+import io
+import itertools
+import json
+import os
+import pandas as pd
+from openpyxl import load_workbook
+from chunking import count_tokens
+from cases import is_separator_row, join_case_row, split_case_row
+
+
+# 人工测试用例的导入：支持xlsx/csv/txt/json(jsonl)，大文件按块流式读取，
+# 每块用pandas的向量化字符串操作拼成markdown表格行，再按token预算切成若干批交给评审模型
+MANUAL_SUFFIXES = ("xlsx", "csv", "txt", "json", "jsonl")
+READ_CHUNK_ROWS = 5000
+# 每一批人工用例（连同表头）的token上限
+DEFAULT_MANUAL_BATCH_TOKENS = 3000
+# 第一批之后的人工用例不再各自进行一次 生成->评审，而是由评审模型逐批单次对照、列出缺漏的测试点，
+# 汇总后只进行一次补充生成，见pipeline.supplement_manual_gaps
+MANUAL_GAP_SOURCE = "manual_gap_model"
+# 每一批最多列出的缺漏测试点数
+MAX_GAPS_PER_BATCH = 10
+# 汇总后交给编写用例模型的缺漏测试点的token上限
+DEFAULT_GAP_TOKENS = 3000
+MANUAL_GAP_PROMPT = """您是一名资深测试项目经理，请对照下面的人工测试用例，检查已生成的测试用例（只列出了用例ID和用例标题）是否有缺漏。
+#输出要求：
+1. 请用简体中文输出内容
+2. 只列出人工测试用例中覆盖了、而已生成的测试用例缺漏的测试点，每行一个，以“- ”开头，最多{max_gaps}个
+3. 没有缺漏时只输出“无”，不要输出其他内容
+#人工测试用例：
+{manual_cases}"""
+
+
+# 向量化地把一块DataFrame拼成 | a | b | c | 形式的表格行
+def frame_to_rows(frame):
+    if frame.empty:
+        return []
+    cells = [frame[column].astype("string").fillna("").str.strip()
+             .str.replace("|", "\\|", regex=False).str.replace(r'\s*\n\s*', "<br>", regex=True)
+             for column in frame.columns]
+    rows = ("| " + cells[0].str.cat(cells[1:], sep=" | ") + " |") if len(cells) > 1 else ("| " + cells[0] + " |")
+    # 全部为空的行没有意义
+    empty = "| " + " | ".join([""] * len(cells)) + " |"
+    return [row for row in rows.tolist() if row.replace(" ", "") != empty.replace(" ", "")]
+
+
+def header_row(columns):
+    return "| " + " | ".join(str(column).strip() for column in columns) + " |"
+
+
+def _iter_frames_xlsx(file):
+    # 只读模式按行读取，不会把整个工作簿加载进内存
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        columns = next(rows, None)
+        if columns is None:
+            return
+        columns = [str(c) if c is not None else f"列{i + 1}" for i, c in enumerate(columns)]
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= READ_CHUNK_ROWS:
+                yield pd.DataFrame(batch, columns=columns)
+                batch = []
+        if batch:
+            yield pd.DataFrame(batch, columns=columns)
+    finally:
+        workbook.close()
+
+
+def _iter_frames_csv(file):
+    yield from pd.read_csv(file, dtype=str, keep_default_na=False, chunksize=READ_CHUNK_ROWS,
+                           encoding_errors="ignore")
+
+
+def _iter_frames_json(file):
+    text = io.TextIOWrapper(file, encoding="utf-8", errors="ignore")
+    first = text.read(1)
+    while first and first.isspace():
+        first = text.read(1)
+    if first == "[":
+        # json数组需要整体解析
+        records = json.loads(first + text.read())
+        for start in range(0, len(records), READ_CHUNK_ROWS):
+            yield pd.DataFrame.from_records(records[start:start + READ_CHUNK_ROWS])
+        return
+    # jsonl：每行一个用例，逐行读取
+    batch = []
+    for line in itertools.chain([first + text.readline()], text):
+        if line.strip():
+            batch.append(json.loads(line))
+        if len(batch) >= READ_CHUNK_ROWS:
+            yield pd.DataFrame.from_records(batch)
+            batch = []
+    if batch:
+        yield pd.DataFrame.from_records(batch)
+
+
+# 读取人工测试用例，返回表格行（第一行为表头，txt文件除外）；file为文件路径或二进制文件对象
+def read_manual_cases(file, name=None):
+    name = name or getattr(file, "name", None) or str(file)
+    suffix = os.path.splitext(name)[1].lower().lstrip(".")
+    if isinstance(file, (str, os.PathLike)):
+        with open(file, 'rb') as f:
+            return read_manual_cases(f, name)
+    if suffix == "txt":
+        text = io.TextIOWrapper(file, encoding="utf-8", errors="ignore")
+        return [line.rstrip("\n") for line in text if line.strip()]
+    readers = {"xlsx": _iter_frames_xlsx, "csv": _iter_frames_csv, "json": _iter_frames_json,
+               "jsonl": _iter_frames_json}
+    if suffix not in readers:
+        raise ValueError(f"不支持的人工测试用例格式：{suffix}")
+    rows = []
+    header = None
+    for frame in readers[suffix](file):
+        if header is None:
+            header = header_row(frame.columns)
+        rows.extend(frame_to_rows(frame))
+    return ([header] if header else []) + rows
+
+
+# 按token预算把人工用例切成若干批，表格形式的每一批都带上表头和分隔行
+def manual_case_batches(lines, max_tokens=DEFAULT_MANUAL_BATCH_TOKENS):
+    if not lines:
+        return []
+    header = []
+    body = lines
+    if lines[0].startswith("|"):
+        width = len(split_case_row(lines[0]))
+        header = [lines[0], join_case_row(["--------"] * width)]
+        body = [line for line in lines[1:] if not is_separator_row(line)]
+    header_tokens = sum(count_tokens(line) + 1 for line in header)
+    batches = []
+    batch = []
+    size = header_tokens
+    for line in body:
+        line_tokens = count_tokens(line) + 1
+        if batch and size + line_tokens > max_tokens:
+            batches.append(batch)
+            batch = []
+            size = header_tokens
+        batch.append(line)
+        size += line_tokens
+    if batch:
+        batches.append(batch)
+    return ["\n".join(header + batch) for batch in batches]
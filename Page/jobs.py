@@ -0,0 +1,231 @@
+import asyncio
+import json
+import os
+import sqlite3
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from cases import data_rows
+from client_pool import get_loop
+from pipeline import create_run_metrics, run_prd
+from prd_parser import describe_images, fill_image_descriptions
+
+
+# 后台生成任务：页面提交任务后立即返回，任务在client_pool的后台事件循环中执行，
+# 进度（模型发言、流式输出、已解析的用例行）和结果写入SQLite，页面按任务ID轮询，刷新浏览器也不会中断或丢失结果。
+# 后台事件循环上同时进行着所有会话的模型流式输出，SQLite的写入和去重都不在这个循环上执行：
+# 写入统一交给一个写入线程按提交顺序执行，去重在线程池中执行。
+# 注意，当前的工作目录是run.py所在的目录
+JOBS_DB = "./Cache/jobs.db"
+# 同时执行的任务数，超出的任务排队等待
+MAX_RUNNING_JOBS = 4
+# 流式输出和用例行写入数据库的最小间隔（秒），完整的发言总是立即写入
+PROGRESS_INTERVAL = 1.0
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+ACTIVE_STATUSES = (QUEUED, RUNNING)
+STATUS_NAMES = {QUEUED: "排队中", RUNNING: "生成中", DONE: "已完成", FAILED: "失败", CANCELLED: "已取消"}
+
+# 以json保存的字段
+JSON_FIELDS = ("rows", "case_list", "metrics", "outcomes")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    label TEXT,
+    status TEXT,
+    created REAL,
+    started REAL,
+    finished REAL,
+    progress TEXT DEFAULT '',
+    output TEXT DEFAULT '',
+    partial TEXT DEFAULT '',
+    rows TEXT DEFAULT '[]',
+    response TEXT,
+    case_list TEXT,
+    duplicates INTEGER DEFAULT 0,
+    metrics TEXT,
+    outcomes TEXT,
+    error TEXT
+)
+"""
+
+
+class JobStore:
+    def __init__(self, path=JOBS_DB):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(SCHEMA)
+            # 上次进程退出时未完成的任务已经无法继续
+            conn.execute("UPDATE jobs SET status = ?, error = ? WHERE status IN (?, ?)",
+                         (FAILED, "服务重启，任务中断", *ACTIVE_STATUSES))
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def create(self, label=""):
+        job_id = uuid.uuid4().hex[:12]
+        with closing(self._connect()) as conn, conn:
+            conn.execute("INSERT INTO jobs (id, label, status, created) VALUES (?, ?, ?, ?)",
+                         (job_id, label, QUEUED, time.time()))
+        return job_id
+
+    def update(self, job_id, append_output="", **fields):
+        for field in JSON_FIELDS:
+            if field in fields:
+                fields[field] = json.dumps(fields[field], ensure_ascii=False)
+        assignments = [f"{field} = ?" for field in fields]
+        values = list(fields.values())
+        if append_output:
+            assignments.append("output = output || ?")
+            values.append(append_output)
+        if not assignments:
+            return
+        with closing(self._connect()) as conn, conn:
+            conn.execute(f"UPDATE jobs SET {', '.join(assignments)} WHERE id = ?", values + [job_id])
+
+    def get(self, job_id):
+        with closing(self._connect()) as conn, conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        for field in JSON_FIELDS:
+            if job[field] is not None:
+                job[field] = json.loads(job[field])
+        return job
+
+    def list(self, limit=50):
+        with closing(self._connect()) as conn, conn:
+            rows = conn.execute(
+                "SELECT id, label, status, created, started, finished, progress, error, "
+                "COALESCE(case_list, rows) AS cases "
+                "FROM jobs ORDER BY created DESC LIMIT ?", (limit,)).fetchall()
+        jobs = [dict(row) for row in rows]
+        # 用例表和实时的用例行都可能带表头和分隔行，只统计数据行
+        for job in jobs:
+            job["cases"] = len(data_rows(json.loads(job["cases"] or "[]")))
+        return jobs
+
+
+_store = None
+_semaphore = None
+_futures = {}
+_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="job-store-writer")
+
+
+def get_store():
+    global _store
+    if _store is None:
+        _store = JobStore()
+    return _store
+
+
+# 在写入线程中更新任务，返回可以await的future；不需要等待写入完成时可以不await
+def update_job(job_id, append_output="", **fields):
+    return asyncio.wrap_future(_writer.submit(get_store().update, job_id, append_output, **fields))
+
+
+# 任务的实时进度：完整的发言立即写入，流式片段和用例行按时间间隔节流写入
+# 回调在后台事件循环中触发，写入交给写入线程，这里只复制当前的内容
+class JobProgress:
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.rows = []
+        self.partial = []
+        self._flushed = 0.0
+
+    def flush(self, append_output=""):
+        self._flushed = time.time()
+        return update_job(self.job_id, append_output=append_output, partial="".join(self.partial),
+                          rows=list(self.rows))
+
+    def _maybe_flush(self):
+        if time.time() - self._flushed > PROGRESS_INTERVAL:
+            self.flush()
+
+    def on_delta(self, text):
+        self.partial.append(text)
+        self._maybe_flush()
+
+    def on_message(self, content):
+        self.partial = []
+        self.flush(append_output=f"{content}\n\n")
+
+    def on_rows(self, rows):
+        self.rows.extend(rows)
+        self._maybe_flush()
+
+    def on_outcomes(self, outcomes):
+        keys = ("model", "score", "cases", "latency", "error")
+        update_job(self.job_id, outcomes=[{key: outcome[key] for key in keys} for outcome in outcomes])
+
+
+async def _run_job(job_id, prd_inputs, gen_role, review_role, label, images, analysis_role, dedupe_threshold,
+                   run_kwargs):
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(MAX_RUNNING_JOBS)
+    try:
+        async with _semaphore:
+            await update_job(job_id, status=RUNNING, started=time.time())
+            progress = JobProgress(job_id)
+            metrics = create_run_metrics(gen_role, review_role, run_id=job_id, label=label or "job")
+            if images and analysis_role is not None:
+                update_job(job_id, progress=f"正在解析文档中的 {len(images)} 张图片")
+                prd_inputs = fill_image_descriptions(prd_inputs, await describe_images(images, analysis_role))
+            update_job(job_id, progress="正在生成测试用例")
+            duplicates = []
+            result, case_list = await run_prd(prd_inputs, gen_role, review_role, metrics=metrics,
+                                              on_message=progress.on_message, on_delta=progress.on_delta,
+                                              on_rows=progress.on_rows, on_outcomes=progress.on_outcomes,
+                                              dedupe_threshold=dedupe_threshold, on_duplicates=duplicates.append,
+                                              **run_kwargs)
+            metrics.finish()
+            await asyncio.to_thread(metrics.write_log)
+            progress.flush()
+            await update_job(job_id, status=DONE, finished=time.time(), progress="", partial="", response=result,
+                             case_list=case_list, duplicates=sum(duplicates), metrics=metrics.to_dict())
+    except asyncio.CancelledError:
+        update_job(job_id, status=CANCELLED, finished=time.time(), progress="")
+        raise
+    except Exception as e:
+        await update_job(job_id, status=FAILED, finished=time.time(), progress="", error=str(e))
+
+
+# 提交生成任务，立即返回任务ID；run_kwargs为pipeline.run_prd的其余参数（用例数量范围、分段、终止策略等）。
+# images和analysis_role不为空时先用文档解析模型解析文档中的图片；dedupe_threshold大于0时去掉近似重复的用例
+def submit_job(prd_inputs, gen_role, review_role, label="", images=None, analysis_role=None, dedupe_threshold=0,
+               **run_kwargs):
+    job_id = get_store().create(label)
+    future = asyncio.run_coroutine_threadsafe(
+        _run_job(job_id, prd_inputs, gen_role, review_role, label, images, analysis_role, dedupe_threshold,
+                 run_kwargs), get_loop())
+    _futures[job_id] = future
+    future.add_done_callback(lambda _: _futures.pop(job_id, None))
+    return job_id
+
+
+def get_job(job_id):
+    return get_store().get(job_id)
+
+
+def list_jobs(limit=50):
+    return get_store().list(limit)
+
+
+# 取消本进程中排队或执行中的任务，执行中的对话组会立即停止调用模型（见pipeline.gen_review_testcases）
+def cancel_job(job_id):
+    future = _futures.get(job_id)
+    if future is None:
+        return False
+    return future.cancel()
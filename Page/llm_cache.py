@@ -0,0 +1,145 @@
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+import time
+from autogen_core import CacheStore
+from autogen_core.models import CreateResult, RequestUsage
+from autogen_ext.models.cache import ChatCompletionCache
+
+
+# 模型回复的磁盘缓存。
+# ChatCompletionCache 会用 (系统提示词 + 对话历史 + 调用参数) 的哈希作为key，
+# 这里再按模型配置划分命名空间，保证不同的模型/参数不会命中彼此的缓存。
+# 注意，当前的工作目录是run.py所在的目录
+CACHE_DIR = "./Cache/llm"
+# 缓存有效期（秒），默认7天
+CACHE_TTL = 7 * 24 * 3600
+# 缓存目录的最大体积（字节），超过后按最近使用时间淘汰
+CACHE_MAX_SIZE = 512 * 1024 * 1024
+# 两次淘汰检查之间的最小间隔（秒），避免每次写入都扫描整个目录
+EVICT_INTERVAL = 60
+# 每个缓存目录上一次淘汰检查的时间；每次运行都会为各个agent新建DiskCacheStore，所以记在模块级别
+_last_evict = {}
+
+
+# 计算模型配置的指纹：模型、接口地址及生成参数相同的配置共享缓存，api_key不参与计算
+def model_config_fingerprint(conf):
+    data = {key: value for key, value in conf.items() if key != "api_key"}
+    serialized = json.dumps(data, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+
+class DiskCacheStore(CacheStore):
+    def __init__(self, directory=CACHE_DIR, namespace="", ttl=CACHE_TTL, max_size=CACHE_MAX_SIZE):
+        self.directory = directory
+        self.namespace = namespace
+        self.ttl = ttl
+        self.max_size = max_size
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        digest = hashlib.sha256(f"{self.namespace}:{key}".encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, f"{digest}.pkl")
+
+    def _expired(self, created):
+        return self.ttl and time.time() - created > self.ttl
+
+    def get(self, key, default=None):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                entry = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return default
+        if self._expired(entry["created"]):
+            self._remove(path)
+            return default
+        # 更新修改时间，作为淘汰时的“最近使用时间”
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return entry["value"]
+
+    def set(self, key, value):
+        entry = {"created": time.time(), "value": value}
+        # 先写临时文件再替换，避免并发读取到写了一半的缓存
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(entry, f)
+            os.replace(tmp_path, self._path(key))
+        except Exception:
+            self._remove(tmp_path)
+            raise
+        if time.time() - _last_evict.get(os.path.abspath(self.directory), 0.0) > EVICT_INTERVAL:
+            self.evict()
+
+    # 删除过期的缓存，并在总体积超出上限时按最近使用时间从旧到新删除
+    def evict(self):
+        _last_evict[os.path.abspath(self.directory)] = time.time()
+        entries = []
+        total_size = 0
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(".pkl"):
+                continue
+            # 页面、命令行和服务共用缓存目录，文件可能已被其他进程删除
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            # 修改时间早于有效期的缓存必然已过期
+            if self._expired(stat.st_mtime):
+                self._remove(entry.path)
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total_size += stat.st_size
+        if self.max_size and total_size > self.max_size:
+            for _, size, path in sorted(entries):
+                self._remove(path)
+                total_size -= size
+                if total_size <= self.max_size:
+                    break
+
+    # 清空缓存目录
+    def clear(self):
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith((".pkl", ".tmp")):
+                self._remove(entry.path)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+# 命中缓存的回复没有实际调用模型，把usage清零，指标中记为0 token。
+# 回复消息（TextMessage）上没有CreateResult.cached，只能在这里处理
+def _without_usage(result):
+    if isinstance(result, CreateResult) and result.cached:
+        return result.model_copy(update={"usage": RequestUsage(prompt_tokens=0, completion_tokens=0)})
+    return result
+
+
+class ResponseCache(ChatCompletionCache):
+    async def create(self, *args, **kwargs):
+        return _without_usage(await super().create(*args, **kwargs))
+
+    def create_stream(self, *args, **kwargs):
+        stream = super().create_stream(*args, **kwargs)
+
+        async def _generator():
+            async for item in stream:
+                yield _without_usage(item)
+
+        return _generator()
+
+
+# 给模型客户端套上磁盘缓存
+def cached_client(model_client, conf, directory=CACHE_DIR):
+    store = DiskCacheStore(directory, namespace=model_config_fingerprint(conf))
+    return ResponseCache(model_client, store)
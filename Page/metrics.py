@@ -0,0 +1,152 @@
+import csv
+import json
+import os
+import time
+import uuid
+from datetime import datetime
+from chunking import count_tokens
+
+
+# 每一轮模型发言的耗时和token统计。
+# token数优先取模型返回的usage（models_usage），没有时（如接口未返回usage）用tiktoken估算：
+# 输入token = 系统提示词 + 之前所有发言，输出token = 本轮发言内容
+# 命中回复缓存的轮次usage为0（见llm_cache.ResponseCache），记为cached
+# 注意，当前的工作目录是run.py所在的目录
+METRICS_DIR = "./Logs"
+METRICS_JSONL = "metrics.jsonl"
+METRICS_CSV = "metrics.csv"
+TURN_FIELDS = ["run_id", "turn", "agent", "prompt_tokens", "completion_tokens", "estimated",
+               "ttft", "latency", "cached"]
+
+
+class RunMetrics:
+    def __init__(self, system_prompts=None, run_id=None, label=""):
+        # system_prompts: {agent名: 系统提示词}，用于估算输入token
+        self.system_prompts = system_prompts or {}
+        self.run_id = run_id or uuid.uuid4().hex[:12]
+        self.label = label
+        self.started_at = datetime.now().isoformat(timespec="seconds")
+        self.turns = []
+        self._started = time.perf_counter()
+        self._turn_started = self._started
+        self._first_token = None
+        self._context_tokens = 0
+        self._finished = None
+        # 对话结束的原因（APPROVE、达到最大轮数、收敛、超时等）
+        self.stop_reason = None
+
+    # 流式输出的第一个片段到达的时间即为首token时间
+    def on_delta(self, text):
+        if self._first_token is None:
+            self._first_token = time.perf_counter()
+
+    # 一条完整的发言（autogen的消息对象）
+    def on_message(self, message):
+        now = time.perf_counter()
+        content = message.content if isinstance(message.content, str) else str(message.content)
+        content_tokens = count_tokens(content)
+        # 任务本身不是模型发言，只计入后续轮次的上下文
+        if message.source != "user":
+            usage = getattr(message, "models_usage", None)
+            estimated = usage is None
+            cached = not estimated and usage.prompt_tokens == 0 and usage.completion_tokens == 0
+            if estimated:
+                prompt_tokens = count_tokens(self.system_prompts.get(message.source, "")) + self._context_tokens
+                completion_tokens = content_tokens
+            else:
+                prompt_tokens = usage.prompt_tokens
+                completion_tokens = usage.completion_tokens
+            self.turns.append({
+                "run_id": self.run_id,
+                "turn": len(self.turns) + 1,
+                "agent": message.source,
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "estimated": estimated,
+                "ttft": round(self._first_token - self._turn_started, 3) if self._first_token else None,
+                "latency": round(now - self._turn_started, 3),
+                "cached": cached,
+            })
+        self._context_tokens += content_tokens
+        self._turn_started = now
+        self._first_token = None
+
+    # 不经过对话组的单次调用（如多模型并行生成时的打分），按模型返回的usage记录一轮
+    def record(self, agent, prompt_tokens, completion_tokens, latency, cached=False):
+        self.turns.append({
+            "run_id": self.run_id,
+            "turn": len(self.turns) + 1,
+            "agent": agent,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "estimated": False,
+            "ttft": None,
+            "latency": round(latency, 3),
+            "cached": cached,
+        })
+
+    # 合并另一个RunMetrics的轮次（如分段生成时各段的统计），轮次编号顺延
+    def merge(self, other):
+        for turn in other.turns:
+            self.turns.append(dict(turn, run_id=self.run_id, turn=len(self.turns) + 1))
+
+    def finish(self):
+        self._finished = time.perf_counter()
+
+    @property
+    def wall_time(self):
+        return (self._finished or time.perf_counter()) - self._started
+
+    # 按agent汇总
+    def summary(self):
+        agents = {}
+        for turn in self.turns:
+            agent = agents.setdefault(turn["agent"], {
+                "agent": turn["agent"], "turns": 0, "prompt_tokens": 0, "completion_tokens": 0,
+                "latency": 0.0, "ttft": [],
+            })
+            agent["turns"] += 1
+            agent["prompt_tokens"] += turn["prompt_tokens"]
+            agent["completion_tokens"] += turn["completion_tokens"]
+            agent["latency"] += turn["latency"]
+            if turn["ttft"] is not None:
+                agent["ttft"].append(turn["ttft"])
+        rows = []
+        for agent in agents.values():
+            rows.append({
+                "agent": agent["agent"],
+                "turns": agent["turns"],
+                "prompt_tokens": agent["prompt_tokens"],
+                "completion_tokens": agent["completion_tokens"],
+                "total_latency": round(agent["latency"], 3),
+                "avg_latency": round(agent["latency"] / agent["turns"], 3),
+                "avg_ttft": round(sum(agent["ttft"]) / len(agent["ttft"]), 3) if agent["ttft"] else None,
+            })
+        return rows
+
+    def to_dict(self):
+        return {
+            "run_id": self.run_id,
+            "label": self.label,
+            "started_at": self.started_at,
+            "wall_time": round(self.wall_time, 3),
+            "stop_reason": self.stop_reason,
+            "prompt_tokens": sum(turn["prompt_tokens"] for turn in self.turns),
+            "completion_tokens": sum(turn["completion_tokens"] for turn in self.turns),
+            "cached_turns": sum(1 for turn in self.turns if turn.get("cached")),
+            "summary": self.summary(),
+            "turns": self.turns,
+        }
+
+    # 追加写入指标日志：每次运行一行json，每一轮一行csv
+    def write_log(self, directory=METRICS_DIR):
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, METRICS_JSONL), 'a', encoding='utf-8') as f:
+            f.write(json.dumps(self.to_dict(), ensure_ascii=False) + "\n")
+        csv_path = os.path.join(directory, METRICS_CSV)
+        write_header = not os.path.exists(csv_path)
+        with open(csv_path, 'a', encoding='utf-8', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=TURN_FIELDS)
+            if write_header:
+                writer.writeheader()
+            writer.writerows(self.turns)
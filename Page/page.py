@@ -1,16 +1,19 @@
-from io import BytesIO
 import streamlit as st
-import pandas as pd
-import json
 import time
-import xlsxwriter
-from autogen_agentchat.conditions import TextMentionTermination
-from autogen_ext.models.openai import OpenAIChatCompletionClient
-from autogen_agentchat.agents import AssistantAgent
-from autogen_agentchat.teams import RoundRobinGroupChat
-import asyncio
-import re
-from utils import model_param_section, save_model_config
+from utils import model_param_section, save_model_config, load_manual_cases, load_prd_document, show_job, \
+    show_job_list
+from jobs import submit_job
+from ingest import DEFAULT_MANUAL_BATCH_TOKENS, MANUAL_SUFFIXES, manual_case_batches
+from chunking import DEFAULT_SECTION_TOKENS
+from termination import DEFAULT_TERMINATION_POLICY
+from dedup import DEFAULT_THRESHOLD
+from fanout import DEFAULT_FANOUT_TIMEOUT, FANOUT_MODES, candidate_name, list_candidates
+from llm_cache import DiskCacheStore
+from config_store import load_json, load_text
+from prd_parser import PRD_SUFFIXES, fill_image_descriptions, supports_vision
+
+# 人工测试用例文本框最多显示的行数
+MANUAL_PREVIEW_ROWS = 200
 
 
 class Page:
@@ -78,29 +81,65 @@ class Page:
                 test_case_count_range = st.slider("**生成测试用例数量范围**", help="指定生成的测试用例数量范围",
                                                   min_value=0,
                                                   max_value=100, value=(0, 0), step=1)
+                # 需求文档、提示词和模型参数都未变化时，直接复用之前的模型回复，不再消耗token
+                use_cache = st.checkbox("**启用模型回复缓存**", value=True,
+                                        help="相同的提示词、对话历史和模型参数会直接返回缓存的回复")
+                # 长需求文档按章节切分后并行生成，避免超出max_tokens导致用例被截断
+                chunked = st.checkbox("**分段并行生成（适用于长文档）**", value=False,
+                                      help="按标题和token数把需求文档切成若干段，各段并行生成后合并去重")
+                section_tokens = st.number_input("**每段最大token数**", min_value=200, max_value=8000,
+                                                 value=DEFAULT_SECTION_TOKENS, step=100, disabled=not chunked)
+                # 需求文档小幅修改后只重新生成有变化的章节，未变化章节的用例和用例ID保持不变
+                incremental = st.checkbox("**增量生成（只重新生成有变化的章节）**", value=False,
+                                          help="与同一文档标识上一次增量生成时的需求文档按章节对比，第一次使用时生成全部章节")
+                incremental_id = st.text_input("**文档标识**", value="", disabled=not incremental,
+                                               help="同一文档每次使用相同的标识，留空时使用上传的文件名或需求的第一行")
+                # 对话的终止策略：评审APPROVE、达到最大轮数/token预算/最长耗时、或修改后没有新增用例时结束
+                policy_cols = st.columns([1, 1, 1])
+                max_turns = policy_cols[0].number_input("**最大发言轮数**", min_value=2, max_value=30,
+                                                        value=DEFAULT_TERMINATION_POLICY["max_turns"], step=1)
+                max_total_tokens = policy_cols[1].number_input(
+                    "**token预算**", min_value=0, value=DEFAULT_TERMINATION_POLICY["max_total_tokens"], step=1000,
+                    help="整个对话最多消耗的token数（输入+输出），0表示不限制")
+                timeout = policy_cols[2].number_input(
+                    "**最长耗时(秒)**", min_value=0, value=DEFAULT_TERMINATION_POLICY["timeout"], step=30,
+                    help="超时后停止对话并保留已生成的用例，0表示不限制")
+                convergence = st.checkbox("**修改后没有新增用例时提前结束**",
+                                          value=DEFAULT_TERMINATION_POLICY["convergence"])
+                compact_history = st.checkbox("**压缩历史用例**", value=DEFAULT_TERMINATION_POLICY["compact_history"],
+                                              help="多轮评审时只把最新一版完整的用例表格发给模型，之前的版本替换为摘要，减少输入token")
+                # 多轮评审、分段生成后换了说法的重复用例，在导出前合并
+                dedupe_cols = st.columns([1, 2])
+                dedupe = dedupe_cols[0].checkbox("**近似重复用例去重**", value=False)
+                dedupe_threshold = dedupe_cols[1].slider("**相似度阈值**", min_value=0.3, max_value=0.9,
+                                                         value=DEFAULT_THRESHOLD, step=0.05, disabled=not dedupe,
+                                                         help="统一同义说法后两条用例整体内容的相似度（Jaccard）达到阈值，"
+                                                              "且标题主体、正反和其中的数字相同才视为重复，只保留内容最完整的一条")
+                if st.button("清空缓存"):
+                    DiskCacheStore().clear()
+                    st.success("缓存已清空！")
 
             with cols_1[0].expander(
                     ":milky_way:**上传人工测试用例（可选）**"):
-                manual_test_cases = st.file_uploader("**用例上传**", type=["xlsx", "txt"])
-                if manual_test_cases is not None:
-                    if manual_test_cases.name.endswith(".xlsx"):
-                        manual_test_cases = pd.read_excel(manual_test_cases)
-                        formatted = []
-                        headers = " | ".join(manual_test_cases.columns)
-                        formatted.append(headers)
-                        # 添加行数据
-                        for _, row in manual_test_cases.iterrows():
-                            formatted.append(" | ".join(str(x) for x in row.values))
-                    elif manual_test_cases.name.endswith('.txt'):
-                        # 处理文本文件
-                        manual_test_cases = manual_test_cases.read().decode("utf-8", 'ignore')
-
+                manual_file = st.file_uploader("**用例上传**", type=list(MANUAL_SUFFIXES))
+                manual_batch_tokens = st.number_input(
+                    "**每批人工用例token数**", min_value=500, max_value=16000, value=DEFAULT_MANUAL_BATCH_TOKENS,
+                    step=500, help="人工用例按此大小分批交给评审模型，超过一批时其余各批由评审模型列出缺漏的测试点，汇总后补充生成一次")
+                manual_lines = load_manual_cases(manual_file.getvalue(), manual_file.name) if manual_file else []
+                # 上万行的用例全部放进文本框会让页面卡住，超过预览行数时只显示前面一部分，生成时使用全部用例
+                large_upload = len(manual_lines) > MANUAL_PREVIEW_ROWS
+                if manual_file is not None:
+                    st.caption(f"共读取 {len(manual_lines)} 行" +
+                               (f"，仅预览前 {MANUAL_PREVIEW_ROWS} 行" if large_upload else ""))
                 manual_case_inputs = st.text_area(
                     "**人工测试用例**",
                     height=200,
-                    value=manual_test_cases,
-                    placeholder="上传测试用例文件或手动在此填写测试用例"
+                    value="\n".join(manual_lines[:MANUAL_PREVIEW_ROWS]),
+                    placeholder="上传测试用例文件或手动在此填写测试用例",
+                    disabled=large_upload
                 )
+                if not large_upload:
+                    manual_lines = [line for line in manual_case_inputs.splitlines() if line.strip()]
 
             # 上传产品需求文档
             with cols_1[0].expander(":fire: **PRD配置（必选）**"):
@@ -109,38 +148,53 @@ class Page:
                 # 可能和streamlit的状态变量的赋值机制有关，需要调研一下
                 st.session_state.image_analysis = st.checkbox("**启用图文档解析功能**",
                                                               value=False)
-                # 上传产品需求文档
-                upload_prd = st.file_uploader("**上传产品需求文档（需要支持更多格式，如带图文档，纯文字文档等）**",
-                                              type="txt")
-                if upload_prd:
-                    if upload_prd.name.endswith("txt"):
-                        upload_prd = upload_prd.read().decode("utf-8", "ignore")
+                # 上传产品需求文档：pdf/docx/图片中的图片在生成用例前交给文档解析模型
+                upload_prd = st.file_uploader("**上传产品需求文档（支持txt、md、pdf、docx及图片）**",
+                                              type=list(PRD_SUFFIXES))
+                prd_document = load_prd_document(upload_prd.getvalue(), upload_prd.name) if upload_prd else None
+                prd_text = prd_document["text"] if prd_document else ""
+                if prd_document and prd_document["images"]:
+                    if st.session_state.image_analysis:
+                        st.caption(f"文档中有 {len(prd_document['images'])} 张图片，生成用例前由文档解析模型解析，"
+                                   f"解析结果替换“【图片n】”标记")
+                    else:
+                        st.caption(f"文档中有 {len(prd_document['images'])} 张图片，启用图文档解析功能后可解析图片内容")
+                        prd_text = fill_image_descriptions(prd_text, {})
                 prd_inputs = st.text_area(
                     "**产品需求文档**",
                     height=200,
-                    value=upload_prd,
+                    value=prd_text,
                     placeholder="请在此详细描述需求"
                 )
 
             # 模型参数配置
             with cols_1[0].expander("**模型参数配置**"):
                 # 注意，当前的工作目录是run.py所在的目录
-                with open("./Templates/gen_cases_model_config.json", 'r') as f:
-                    gen_cases_model_config = json.load(f)
-                with open("./Templates/review_cases_model_config.json", 'r') as f:
-                    review_cases_model_config = json.load(f)
+                # 配置文件只在修改后重新读取
+                gen_cases_model_config = load_json("./Templates/gen_cases_model_config.json")
+                review_cases_model_config = load_json("./Templates/review_cases_model_config.json")
 
                 api_key_1, base_url_1, model_1, max_tokens_1, temperature_1, top_p_1, base_url_list_1, model_list_1, model_select_1 = model_param_section(
                     "编写用例模型参数设置（更多参数等待探索）", key_prefix="param_1", config_value=gen_cases_model_config
                 )
+                # 同一需求同时交给多个模型生成，由评审模型打分后取最优或合并
+                fanout_cols = st.columns([2, 1, 1])
+                fanout_candidates = fanout_cols[0].multiselect(
+                    "**多模型并行生成（选择两个及以上模型时启用）**", options=list_candidates(gen_cases_model_config),
+                    format_func=candidate_name, key="param_1_fanout")
+                fanout_mode = fanout_cols[1].selectbox("**结果选取**", options=FANOUT_MODES,
+                                                       format_func=lambda x: {"best": "取最高分", "union": "合并全部"}[x],
+                                                       key="param_1_fanout_mode")
+                fanout_timeout = fanout_cols[2].number_input("**单模型最长耗时(秒)**", min_value=10,
+                                                             value=DEFAULT_FANOUT_TIMEOUT, step=10,
+                                                             key="param_1_fanout_timeout")
 
                 api_key_2, base_url_2, model_2, max_tokens_2, temperature_2, top_p_2, base_url_list_2, model_list_2, model_select_2 = model_param_section(
                     "评审用例模型参数设置", key_prefix="param_2", config_value=review_cases_model_config
                 )
 
                 if st.session_state.image_analysis:
-                    with open("./Templates/analysis_prd_model_config.json", 'r') as f:
-                        analysis_prd_model_config = json.load(f)
+                    analysis_prd_model_config = load_json("./Templates/analysis_prd_model_config.json")
                     api_key_3, base_url_3, model_3, max_tokens_3, temperature_3, top_p_3, base_url_list_3, model_list_3, model_select_3 = model_param_section(
                         "文档解析模型参数设置", key_prefix="param_3", config_value=analysis_prd_model_config
                     )
@@ -182,22 +236,19 @@ class Page:
 
             # 给编写用例的LLM的提示词
             with cols_1[1].expander(":palm_tree: **编写用例模型提示词（必选）**"):
-                with open('./Templates/gen_cases_model_prompt.txt', 'r', encoding='utf-8') as f:
-                    gen_cases_model_prompt = f.read()
+                gen_cases_model_prompt = load_text('./Templates/gen_cases_model_prompt.txt')
                 gen_cases_model_prompt = st.text_area("**编写用例提示词预览**", height=400,
                                                       value=gen_cases_model_prompt,
                                                       placeholder="need_to_config")
             # 给评审用例的LLM的提示词
             with cols_1[1].expander(":cyclone: **评审用例模型提示词（必选）**"):
-                with open('./Templates/review_cases_model_prompt.txt', 'r', encoding='utf-8') as f:
-                    review_cases_model_prompt = f.read()
+                review_cases_model_prompt = load_text('./Templates/review_cases_model_prompt.txt')
                 review_cases_model_prompt = st.text_area("**评审用例提示词预览**", height=400,
                                                          value=review_cases_model_prompt, placeholder="need_to_config")
             if st.session_state.image_analysis:
                 # 给文档解析的LLM的提示词
                 with cols_1[1].expander(":maple_leaf: **文档解析模型提示词（必选）**"):
-                    with open('./Templates/analysis_prd_model_prompt.txt', 'r', encoding='utf-8') as f:
-                        analysis_prd_model_prompt = f.read()
+                    analysis_prd_model_prompt = load_text('./Templates/analysis_prd_model_prompt.txt')
                     analysis_prd_model_prompt = st.text_area("**文档解析提示词预览**", height=400,
                                                              value=analysis_prd_model_prompt,
                                                              placeholder="need_to_config")
@@ -205,177 +256,62 @@ class Page:
             button_placeholder = st.empty()
             gen_cases_button = button_placeholder.button("生成测试用例", disabled=False, key="gen_cases_button")
 
-            if gen_cases_button and prd_inputs:
-                # task: 需要大模型合作完成的任务
-                st.session_state.running_cases_now = True
-                button_placeholder.empty()
-                button_placeholder.button("生成测试用例", disabled=True, key="gen_cases_button_disabled")
-
-                if test_case_count_range != (0, 0):
-                    task = f"""
-                    需求描述：{prd_inputs}
-                    【重要】：最少生成{test_case_count_range[0]}条用例，最多生成{test_case_count_range[1]}条用例
-                    """
-                else:
-                    task = f"""
-                    需求描述：{prd_inputs}
-                    """
-
-                # 模型输出内容的显示区域
-                response_container = st.container()
-
+            if gen_cases_button and prd_inputs and prd_inputs.strip():
                 # 生成并评审用例
-                async def gen_review_testcases():
-                    # 接受模型回复的内容
-                    response = ""
-                    termination_condition = TextMentionTermination("APPROVE")
-                    # 创建生成测试用例的补全式的对话客户端
-                    # TODO 注意：model_select_1是生成测试用例时选择的模型名，model_select_2是评审测试用例时选择的模型名，
-                    #  model_select_3是图文解析时选择的模型名，后续会更改这三个命名，显得更加直观
-                    # 1.模型调用
-                    gen_cases_model = OpenAIChatCompletionClient(
-                        model=gen_cases_model_config[model_select_1]['model'],
-                        base_url=gen_cases_model_config[model_select_1]['base_url'],
-                        api_key=gen_cases_model_config[model_select_1]['api_key'],
-                        model_info=gen_cases_model_config[model_select_1]["model_info"],
-                    )
-                    # 2.agent抽象
-                    gen_cases_model = AssistantAgent(name="gen_cases_model", model_client=gen_cases_model,
-                                                     system_message=gen_cases_model_prompt)
-                    # 创建评审测试用例的补全式的对话客户端
-                    review_cases_model = OpenAIChatCompletionClient(
-                        model=review_cases_model_config[model_select_2]['model'],
-                        base_url=review_cases_model_config[model_select_2]['base_url'],
-                        api_key=review_cases_model_config[model_select_2]['api_key'],
-                        model_info=review_cases_model_config[model_select_2]["model_info"],
-                    )
-                    review_cases_model = AssistantAgent(name="review_cases_model", model_client=review_cases_model,
-                                                        system_message=review_cases_model_prompt)
-                    # 创建对话组
-                    chat_team = RoundRobinGroupChat(
-                        participants=[gen_cases_model, review_cases_model],
-                        termination_condition=termination_condition,
-                        max_turns=10,
-                    )
-
-                    # 创建一个空元素用于更新内容
-                    with response_container:
-                        # st.empty() 是一个占位符，只能显示当前一次的内容
-                        response_display = st.empty()
-
-                    # # 用来标志对话是否结束，若已经结束，终止词后面的模型输出内容不会再显示
-                    # is_continue = True
-                    # 模型组开始解决指定任务
-                    async for chunk in chat_team.run_stream(task=task):
-                        # 存储模型发言时生成的内容
-                        content = ""
-                        # chunk有好几种返回对象
-                        # TODO 具体有哪些类别需要再研究下
-                        if chunk:
-                            # 处理不同类型的chunk
-                            if hasattr(chunk, 'content') and hasattr(chunk, 'type'):
-                                if chunk.type != 'ModelClientStreamingChunkEvent':
-                                    content = chunk.content
-                            elif isinstance(chunk, str):
-                                content = chunk
-                            else:
-                                content = str(chunk)
-                            # 将新内容添加到完整响应中
-                            # if is_continue and content != "" and not content.startswith("TaskResult"):
-                            #     response += '\n\n' + content
-                            if content != "" and not content.startswith("TaskResult"):
-                                response += '\n\n' + content
-                            # 更新显示区域
-                            response_display.markdown(response)
-                            # 若模型发言中输出APPROVE，即意味着对话结束，后续输出内容不会再被记录
-                            if content.find("APPROVE") > 0:
-                                # is_continue = False
-                                break
-
-                    # 返回模型的所有输出结果
-                    return response
-
-                # 重新拉取消息
-                def show_message(message):
-                    case_list_new = message
-                    with response_container:
-                        placeholder = st.empty()
-                        placeholder.markdown(message)
-                        st.success("✅ 测试用例生成完成!")
-                        st.download_button(
-                            label="下载测试用例(.md)",
-                            data="\n".join(case_list_new),
-                            file_name="测试用例.md",
-                            mime="text/markdown",
-                            icon=":material/markdown:",
-                        )
-
-                        st.download_button(
-                            label="下载测试用例(.xlsx)",
-                            data=output.getvalue(),
-                            file_name="测试用例.xlsx",
-                            mime="application/vnd.ms-excel",
-                            icon=":material/download:",
-                        )
-
-                # 对于需要执行复杂计算或数据处理的函数，使用@st.cache_resource可以避免每次重新计算。
-                # 函数的输入相同，返回的结果也会被缓存，以便下次直接使用缓存的结果。
-                @st.cache_resource
-                def format_testcases(raw_output):
-                    cases = re.findall(r'(\|.+\|)', raw_output, re.IGNORECASE)
-                    print(dict.fromkeys(cases))
-                    new_cases = list(dict.fromkeys(cases))
-                    return new_cases
-
-                try:
-                    with st.spinner("正在生成测试用例..."):
-                        result = asyncio.run(gen_review_testcases())
-                        case_list = format_testcases(result)
-                    st.success("✅ 测试用例生成完成!")
-                    if len(case_list):
-                        st.download_button(
-                            label="下载测试用例(.md)",
-                            data="\n".join(case_list),
-                            file_name="测试用例.md",
-                            mime="text/markdown",
-                            icon=":material/markdown:",
-                            on_click=show_message,
-                            args=(result,),
-                        )
-                        output = BytesIO()
-                        workbook = xlsxwriter.Workbook(output, {'in_memory': True})
-                        worksheet = workbook.add_worksheet()
-                        for row, case in enumerate(case_list):
-                            if case.find("--------") < 0:
-                                for col, cell in enumerate(case.split("|")):
-                                    if col > 0:
-                                        if row > 1:
-                                            worksheet.write(row - 1, col - 1, str(cell).strip())
-                                        else:
-                                            worksheet.write(row, col - 1, str(cell).strip())
-                        workbook.close()
-                        st.download_button(
-                            label="下载测试用例(.xlsx)",
-                            data=output.getvalue(),
-                            file_name="测试用例.xlsx",
-                            mime="application/vnd.ms-excel",
-                            icon=":material/download:",
-                            on_click=show_message,
-                            args=(result,),
-                        )
-                except Exception as e:
-                    st.error(f"生成测试用例时出错: {str(e)}")
-
-                button_placeholder.empty()
-
-            elif gen_cases_button and not prd_inputs:
+                # TODO 注意：model_select_1是生成测试用例时选择的模型名，model_select_2是评审测试用例时选择的模型名，
+                #  model_select_3是图文解析时选择的模型名，后续会更改这三个命名，显得更加直观
+                gen_role = {"config": gen_cases_model_config, "model_select": model_select_1,
+                            "prompt": gen_cases_model_prompt, "use_cache": use_cache}
+                review_role = {"config": review_cases_model_config, "model_select": model_select_2,
+                               "prompt": review_cases_model_prompt, "use_cache": use_cache}
+
+                # 文档中的图片在任务中并发交给文档解析模型，解析结果替换文字中的图片标记
+                images = None
+                analysis_role = None
+                if st.session_state.image_analysis and prd_document and prd_document["images"]:
+                    analysis_role = {"config": analysis_prd_model_config, "model_select": model_select_3,
+                                     "prompt": analysis_prd_model_prompt, "use_cache": use_cache}
+                    if supports_vision(analysis_role):
+                        images = prd_document["images"]
+                    else:
+                        st.warning("文档解析模型未开启图片输入（model_info中的vision），文档中的图片未解析")
+                        prd_inputs = fill_image_descriptions(prd_inputs, {})
+
+                policy = {"max_turns": max_turns, "max_total_tokens": max_total_tokens, "timeout": timeout,
+                          "convergence": convergence, "compact_history": compact_history}
+                # 同时选择两个及以上模型时多模型并行生成
+                fanout = None
+                if len(fanout_candidates) > 1:
+                    fanout = {"candidates": fanout_candidates, "mode": fanout_mode, "timeout": fanout_timeout}
+
+                label = prd_inputs.strip().splitlines()[0][:30]
+                if incremental:
+                    incremental_id = incremental_id.strip() or (upload_prd.name if upload_prd else label)
+                # 提交后台任务后立即返回，任务ID放在地址栏中，刷新页面后仍能看到进度和结果
+                job_id = submit_job(prd_inputs, gen_role, review_role, label=label,
+                                    images=images, analysis_role=analysis_role,
+                                    dedupe_threshold=dedupe_threshold if dedupe else 0,
+                                    test_case_count_range=test_case_count_range,
+                                    section_tokens=section_tokens if chunked else 0, policy=policy, fanout=fanout,
+                                    incremental_id=incremental_id if incremental else None,
+                                    # 人工测试用例按token预算分批，生成阶段的评审对照第一批
+                                    manual_batches=manual_case_batches(manual_lines, manual_batch_tokens))
+                st.query_params["job"] = job_id
+
+            elif gen_cases_button:
                 error_message = st.empty()
                 error_message.error("输入异常：缺少必要的输入,请提供正确的输入!")
                 time.sleep(2)
                 error_message.empty()
 
+            if "job" in st.query_params:
+                show_job(st.query_params["job"])
+
         with pagination_2:
-            st.write("need_todo")
+            st.caption("命令行运行 `python serve.py` 启动HTTP/MCP服务：`POST /generate` 以NDJSON流式返回用例行，"
+                       "`/mcp` 提供generate_test_cases工具；`python serve.py --stdio` 供本地MCP客户端启动")
+            # 所有生成任务（含其他用户提交的任务）
+            show_job_list()
 
 
 if __name__ == "__main__":
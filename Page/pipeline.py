@@ -0,0 +1,421 @@
+import asyncio
+import math
+import os
+from autogen_agentchat.base import TaskResult
+from autogen_core import CancellationToken
+from autogen_agentchat.agents import AssistantAgent
+from autogen_agentchat.teams import RoundRobinGroupChat
+from cases import merge_testcases, append_testcases, cases_to_markdown, data_rows, split_case_row
+from exporter import export_cases
+from dedup import dedupe_testcases
+from chunking import chunk_prd, count_tokens
+from stream_parser import CaseRowParser
+from metrics import RunMetrics
+from termination import GEN_SOURCE, REVIEW_SOURCE, build_termination, resolve_policy
+from clients import complete, create_model_client
+from fanout import gen_fanout
+from compaction import CompactedChatContext
+from ingest import DEFAULT_GAP_TOKENS, MANUAL_GAP_PROMPT, MANUAL_GAP_SOURCE, MAX_GAPS_PER_BATCH
+from incremental import UNCHANGED, add_supplement_rows, build_case_list, describe_diff, diff_sections, \
+    diff_summary, load_state, prepare_sections, save_state
+
+
+# 生成 -> 评审 的流水线，与Streamlit页面解耦，页面和批量命令行（batch_run.py）共用这里的逻辑。
+# 一个“角色”用字典描述：{"config": 模型配置json, "model_select": 选中的模型厂商, "prompt": 系统提示词,
+#                       "use_cache": 是否启用模型回复的磁盘缓存（可选）}
+
+
+# 根据需求文档和用例数量范围构造交给模型组的任务
+def build_task(prd_inputs, test_case_count_range=(0, 0)):
+    if tuple(test_case_count_range) != (0, 0):
+        task = f"""
+                    需求描述：{prd_inputs}
+                    【重要】：最少生成{test_case_count_range[0]}条用例，最多生成{test_case_count_range[1]}条用例
+                    """
+    else:
+        task = f"""
+                    需求描述：{prd_inputs}
+                    """
+    return task
+
+
+# agent抽象，stream为True时模型以流式输出，run_stream会额外产生ModelClientStreamingChunkEvent；
+# compact为True时发给模型的历史中只保留最新一版完整的用例表格
+def create_agent(name, role, stream=False, compact=False):
+    model_client = create_model_client(role["config"], role["model_select"], role.get("use_cache", False), stream)
+    return AssistantAgent(name=name, model_client=model_client, system_message=role["prompt"],
+                          model_client_stream=stream, model_context=CompactedChatContext() if compact else None)
+
+
+# chunk有好几种返回对象，统一取出其中的文本内容
+def extract_chunk_content(chunk):
+    content = ""
+    if chunk:
+        if hasattr(chunk, 'content') and hasattr(chunk, 'type'):
+            if chunk.type != 'ModelClientStreamingChunkEvent':
+                content = chunk.content
+        elif isinstance(chunk, str):
+            content = chunk
+        else:
+            content = str(chunk)
+    return content
+
+
+# 为一次 生成->评审 创建耗时和token统计
+def create_run_metrics(gen_role, review_role, run_id=None, label=""):
+    return RunMetrics({GEN_SOURCE: gen_role["prompt"], REVIEW_SOURCE: review_role["prompt"]},
+                      run_id=run_id, label=label)
+
+
+# 生成并评审用例
+#   on_message(content)：每条完整的发言，用于页面逐条显示
+#   on_delta(text)：模型流式输出的片段，传入时agent开启流式输出
+#   parser：CaseRowParser，对话进行中即从编写用例模型的发言解析出已完成的用例行，结束后parser.rows即为全部用例行
+#   metrics：RunMetrics，记录每一轮的token、首token时间和耗时（需要流式输出才能得到首token时间）
+#   policy：终止策略，见 termination.DEFAULT_TERMINATION_POLICY
+async def gen_review_testcases(task, gen_role, review_role, on_message=None, on_delta=None, parser=None,
+                               metrics=None, policy=None):
+    policy = resolve_policy(policy)
+    # 接受模型回复的内容
+    response = []
+    stop_reason = None
+    stream = (on_delta is not None or metrics is not None
+              or (parser is not None and parser.on_rows is not None))
+    gen_cases_model = create_agent(GEN_SOURCE, gen_role, stream, policy["compact_history"])
+    review_cases_model = create_agent(REVIEW_SOURCE, review_role, stream, policy["compact_history"])
+    # 创建对话组
+    chat_team = RoundRobinGroupChat(
+        participants=[gen_cases_model, review_cases_model],
+        termination_condition=build_termination(policy),
+        max_turns=policy["max_turns"],
+    )
+    cancellation_token = CancellationToken()
+
+    async def consume():
+        nonlocal stop_reason
+        # 模型组开始解决指定任务
+        async for chunk in chat_team.run_stream(task=task, cancellation_token=cancellation_token):
+            if isinstance(chunk, TaskResult):
+                stop_reason = chunk.stop_reason
+                continue
+            # 只从编写用例模型的发言中解析用例，任务中的需求文档和评审意见中的表格不是用例
+            from_gen = getattr(chunk, 'source', None) == GEN_SOURCE
+            if getattr(chunk, 'type', None) == 'ModelClientStreamingChunkEvent':
+                if parser is not None and from_gen:
+                    parser.feed(chunk.content)
+                if on_delta is not None:
+                    on_delta(chunk.content)
+                if metrics is not None:
+                    metrics.on_delta(chunk.content)
+                continue
+            # 存储模型发言时生成的内容
+            content = extract_chunk_content(chunk)
+            if content != "":
+                response.append(content)
+                if parser is not None and from_gen:
+                    parser.feed_message(content)
+                if metrics is not None and hasattr(chunk, 'source'):
+                    metrics.on_message(chunk)
+                if on_message is not None:
+                    on_message(content)
+
+    # run_stream被取消后会等对话自然结束才退出，超时或任务被取消时要先取消cancellation_token，模型调用才会立即停止
+    consume_task = asyncio.ensure_future(consume())
+    try:
+        done, _ = await asyncio.wait({consume_task}, timeout=policy["timeout"] or None)
+    except asyncio.CancelledError:
+        cancellation_token.cancel()
+        consume_task.cancel()
+        await asyncio.gather(consume_task, return_exceptions=True)
+        raise
+    if done:
+        consume_task.result()
+    else:
+        # 超时后停止对话，保留已经生成的内容
+        cancellation_token.cancel()
+        consume_task.cancel()
+        await asyncio.gather(consume_task, return_exceptions=True)
+        stop_reason = f"超过最长耗时{policy['timeout']}秒"
+
+    if parser is not None:
+        parser.flush()
+    if metrics is not None:
+        metrics.stop_reason = stop_reason
+        metrics.finish()
+    # 返回模型的所有输出结果
+    return "".join('\n\n' + content for content in response)
+
+
+# 把第index批人工测试用例附加到评审模型的提示词中，评审时与生成的用例对照
+def with_manual_cases(review_role, manual_batches, index=0):
+    if not manual_batches:
+        return review_role
+    prompt = (f"{review_role['prompt']}\n#人工测试用例（第{index + 1}/{len(manual_batches)}批）：\n"
+              f"{manual_batches[index]}")
+    return {**review_role, "prompt": prompt}
+
+
+# 已生成用例的概要（用例ID和用例标题），逐批对照人工用例时代替完整的用例表格，输入不随用例内容增长
+def case_outline(case_list):
+    return "\n".join(" ".join(split_case_row(row)[:2]) for row in data_rows(case_list))
+
+
+# 评审模型单次对照一批人工测试用例，返回缺漏的测试点
+async def find_manual_gaps(review_role, outline, manual_batch, metrics=None):
+    role = {**review_role, "prompt": MANUAL_GAP_PROMPT.format(max_gaps=MAX_GAPS_PER_BATCH, manual_cases=manual_batch)}
+    reply = await complete(role, f"已生成的测试用例：\n{outline}", metrics, MANUAL_GAP_SOURCE)
+    gaps = [line.strip()[2:].strip() for line in reply.splitlines() if line.strip().startswith("- ")]
+    return [gap for gap in gaps if gap][:MAX_GAPS_PER_BATCH]
+
+
+# 人工测试用例较多时：生成阶段的评审只带第一批，之后各批由评审模型并行地单次对照、列出缺漏的测试点，
+# 汇总去重（不超过max_gap_tokens）后只进行一次补充的 生成->评审，新增的用例接着原有编号追加。
+# 模型调用次数随批数线性增长，每次调用的输入不随批数增长。返回 (补充过程的输出, 追加后的用例行)
+async def supplement_manual_gaps(task, case_list, gen_role, review_role, manual_batches, start=1, concurrency=4,
+                                 max_gap_tokens=DEFAULT_GAP_TOKENS, on_message=None, on_delta=None, on_rows=None,
+                                 metrics=None, policy=None):
+    outline = case_outline(case_list)
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def check(manual_batch):
+        async with semaphore:
+            return await find_manual_gaps(review_role, outline, manual_batch, metrics)
+
+    gap_lists = await asyncio.gather(*(check(manual_batch) for manual_batch in manual_batches[start:]))
+    found = list(dict.fromkeys(gap for gap_list in gap_lists for gap in gap_list))
+    gaps = []
+    size = 0
+    for gap in found:
+        size += count_tokens(gap) + 1
+        if size > max_gap_tokens:
+            break
+        gaps.append(gap)
+    summary = (f"对照其余{len(manual_batches) - start}批人工测试用例，发现{len(found)}个缺漏的测试点" +
+               (f"，篇幅所限只补充前{len(gaps)}个" if len(gaps) < len(found) else ""))
+    gap_text = "\n".join(f"- {gap}" for gap in gaps)
+    if on_message is not None:
+        on_message(f"{summary}\n{gap_text}")
+    response = ""
+    if gaps:
+        supplement_task = (f"{task}\n已生成的测试用例：\n{cases_to_markdown(case_list)}\n"
+                           f"与人工测试用例对照后缺漏的测试点：\n{gap_text}\n"
+                           f"请针对这些测试点补充测试用例，已有的用例不需要重复输出")
+        parser = CaseRowParser(on_rows=on_rows)
+        supplement_metrics = create_run_metrics(gen_role, review_role) if metrics is not None else None
+        response = await gen_review_testcases(supplement_task, gen_role, review_role, on_message=on_message,
+                                              on_delta=on_delta, parser=parser, metrics=supplement_metrics,
+                                              policy=policy)
+        if metrics is not None:
+            metrics.merge(supplement_metrics)
+        case_list = append_testcases(case_list, parser.rows)
+    if metrics is not None:
+        metrics.finish()
+    return f"### 人工测试用例对照\n{summary}\n{gap_text}\n{response}", case_list
+
+
+# 按各段的token占比分配用例数量范围
+def split_case_count_range(test_case_count_range, chunks):
+    if tuple(test_case_count_range) == (0, 0):
+        return [(0, 0)] * len(chunks)
+    total = sum(chunk["tokens"] for chunk in chunks) or 1
+    ranges = []
+    for chunk in chunks:
+        share = chunk["tokens"] / total
+        ranges.append((math.ceil(test_case_count_range[0] * share),
+                       max(1, math.ceil(test_case_count_range[1] * share))))
+    return ranges
+
+
+# 把各段的模型输出拼成一份，按段落标注来源
+def combine_section_responses(chunks, responses):
+    return "\n\n".join(f"### 第{i}部分：{chunk['title']}\n{response}"
+                        for i, (chunk, response) in enumerate(zip(chunks, responses), start=1) if response)
+
+
+# 各段并行进行 生成->评审，返回 (各段的模型输出, 各段解析出的用例行)；
+# chunk中的position和total为该段在整篇文档中的序号和总段数，缺省时按chunks中的顺序编号
+async def gen_review_sections(chunks, ranges, gen_role, review_role, concurrency=4, on_message=None, on_rows=None,
+                              metrics=None, policy=None, total=None):
+    total = total or len(chunks)
+    responses = [""] * len(chunks)
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def run_chunk(index, chunk):
+        position = chunk.get("position", index + 1)
+
+        def show(content):
+            if on_message is not None:
+                on_message(f"**第{position}部分：{chunk['title']}**\n\n{content}")
+
+        async with semaphore:
+            section = f"（以下为需求文档的第{position}/{total}部分，只需针对这一部分编写用例）\n{chunk['content']}"
+            task = build_task(section, ranges[index])
+            parser = CaseRowParser(on_rows=on_rows)
+            section_metrics = create_run_metrics(gen_role, review_role) if metrics is not None else None
+            responses[index] = await gen_review_testcases(task, gen_role, review_role, on_message=show,
+                                                          parser=parser, metrics=section_metrics, policy=policy)
+            if metrics is not None:
+                metrics.merge(section_metrics)
+            return parser.rows
+
+    case_lists = await asyncio.gather(*(run_chunk(i, chunk) for i, chunk in enumerate(chunks)))
+    return responses, case_lists
+
+
+# 分段生成：长需求文档按章节切成若干段，各段并行进行 生成->评审，最后合并去重并重新编号用例ID
+# on_rows(rows)在任一段解析出新的用例行时被调用（此时用例ID尚未重新编号）；
+# 传入metrics时各段分别统计，结束后合并到metrics中
+async def gen_review_chunked(prd_inputs, gen_role, review_role, test_case_count_range=(0, 0),
+                             section_tokens=None, concurrency=4, on_message=None, on_rows=None, metrics=None,
+                             policy=None):
+    chunks = chunk_prd(prd_inputs, section_tokens) if section_tokens else chunk_prd(prd_inputs)
+    ranges = split_case_count_range(test_case_count_range, chunks)
+    responses, case_lists = await gen_review_sections(chunks, ranges, gen_role, review_role, concurrency,
+                                                      on_message=on_message, on_rows=on_rows, metrics=metrics,
+                                                      policy=policy)
+    if metrics is not None:
+        metrics.finish()
+    return combine_section_responses(chunks, responses), merge_testcases(case_lists)
+
+
+# 增量生成：与doc_id上一次生成时的需求文档按章节对比，只对新增和有变化的章节进行 生成->评审，
+# 未变化章节的用例和用例ID保持不变，见incremental.py。
+# on_diff(对比结果)在开始生成前被调用，对比结果为 {"unchanged"/"changed"/"added"/"removed": [章节标题]}；
+# test_case_count_range是整篇文档的用例数量范围，按token数比例分给需要重新生成的章节；
+# dedupe_threshold大于0时只去掉重新生成的用例中近似重复的，保留下来的用例不受影响，on_duplicates(去掉的数量)接收结果；
+# 返回 (原始输出, 用例行, 新的记录)，记录由调用方在全部完成后保存（见run_prd，人工测试用例对照补充的用例也要记入）
+async def gen_review_incremental(doc_id, prd_inputs, gen_role, review_role, test_case_count_range=(0, 0),
+                                 concurrency=4, on_message=None, on_rows=None, on_diff=None, metrics=None,
+                                 policy=None, dedupe_threshold=0, on_duplicates=None):
+    state = load_state(doc_id)
+    sections = prepare_sections(prd_inputs)
+    plan, removed = diff_sections(state["sections"], sections)
+    summary = diff_summary(plan, removed)
+    if on_diff is not None:
+        on_diff(summary)
+    if on_message is not None:
+        on_message(describe_diff(summary))
+    chunks = [section for status, section, _ in plan if status != UNCHANGED]
+    responses, case_lists = [], []
+    if chunks:
+        ranges = split_case_count_range(test_case_count_range, sections)
+        responses, case_lists = await gen_review_sections(
+            chunks, [ranges[chunk["position"] - 1] for chunk in chunks], gen_role, review_role, concurrency,
+            on_message=on_message, on_rows=on_rows, metrics=metrics, policy=policy, total=len(sections))
+    if metrics is not None:
+        metrics.finish()
+    generated = {chunk["position"]: rows for chunk, rows in zip(chunks, case_lists)}
+    case_list, new_state, duplicates = await asyncio.to_thread(build_case_list, doc_id, prd_inputs, plan, generated,
+                                                               state, dedupe_threshold)
+    if on_duplicates is not None:
+        on_duplicates(duplicates)
+    return f"{describe_diff(summary)}\n\n{combine_section_responses(chunks, responses)}", case_list, new_state
+
+
+# 为单个需求文档生成用例，返回原始输出和格式化后的用例行；section_tokens大于0时分段生成；
+# fanout为{"candidates": [(模型厂商, 模型名)], "mode": "best"/"union", "timeout": 秒}时多模型并行生成，
+# 每个模型各自按policy评审，on_outcomes(outcomes)接收各模型的得分等结果；
+# incremental_id不为空时按该文档标识增量生成（忽略section_tokens和fanout），on_diff接收章节对比结果，见gen_review_incremental；
+# manual_batches为按批切好的人工测试用例（见ingest.manual_case_batches），评审时对照；
+# dedupe_threshold大于0时去掉近似重复的用例（在线程中执行），on_duplicates(去掉的数量)接收结果，
+# 增量生成时只去掉新生成的用例，不会替换保留下来的用例；
+# on_message/on_delta/on_rows用于实时显示，见gen_review_testcases
+async def run_prd(prd_inputs, gen_role, review_role, test_case_count_range=(0, 0), section_tokens=0,
+                  metrics=None, policy=None, fanout=None, manual_batches=None, on_message=None, on_delta=None,
+                  on_rows=None, on_outcomes=None, incremental_id=None, on_diff=None, dedupe_threshold=0,
+                  on_duplicates=None):
+    task = build_task(prd_inputs, test_case_count_range)
+    first_review_role = with_manual_cases(review_role, manual_batches)
+    duplicates = 0
+    if incremental_id:
+        def count_duplicates(count):
+            nonlocal duplicates
+            duplicates = count
+
+        result, case_list, state = await gen_review_incremental(
+            incremental_id, prd_inputs, gen_role, first_review_role, test_case_count_range, on_message=on_message,
+            on_rows=on_rows, on_diff=on_diff, metrics=metrics, policy=policy, dedupe_threshold=dedupe_threshold,
+            on_duplicates=count_duplicates)
+    elif fanout and fanout.get("candidates"):
+        result, case_list, outcomes = await gen_fanout(task, prd_inputs, gen_role, first_review_role,
+                                                       generate=gen_review_testcases, **fanout,
+                                                       on_message=on_message, on_rows=on_rows, metrics=metrics,
+                                                       policy=policy)
+        if on_outcomes is not None:
+            on_outcomes(outcomes)
+    elif section_tokens:
+        result, case_list = await gen_review_chunked(prd_inputs, gen_role, first_review_role, test_case_count_range,
+                                                     section_tokens=section_tokens, on_message=on_message,
+                                                     on_rows=on_rows, metrics=metrics, policy=policy)
+    else:
+        parser = CaseRowParser(on_rows=on_rows)
+        result = await gen_review_testcases(task, gen_role, first_review_role, on_message=on_message,
+                                            on_delta=on_delta, parser=parser, metrics=metrics, policy=policy)
+        case_list = parser.rows
+    # 增量生成的用例已经去过重，只对之后补充的用例去重
+    kept = len(data_rows(case_list)) if incremental_id else 0
+    if manual_batches and len(manual_batches) > 1:
+        supplement, case_list = await supplement_manual_gaps(task, case_list, gen_role, review_role, manual_batches,
+                                                             on_message=on_message, on_delta=on_delta,
+                                                             on_rows=on_rows, metrics=metrics, policy=policy)
+        result = f"{result}\n\n{supplement}"
+    if dedupe_threshold and len(data_rows(case_list)) > kept:
+        case_list, removed = await asyncio.to_thread(dedupe_testcases, case_list, dedupe_threshold, kept)
+        duplicates += removed
+    if dedupe_threshold and on_duplicates is not None:
+        on_duplicates(duplicates)
+    # 增量生成时补充的用例接着记录中的序号编号并记入记录，下一次增量生成时保留；去重和补充都完成后才保存记录
+    if incremental_id:
+        rows = data_rows(case_list)
+        case_list = case_list[:len(case_list) - len(rows)] + rows[:kept] + add_supplement_rows(state, rows[kept:])
+        await asyncio.to_thread(save_state, state)
+    return result, case_list
+
+
+# 将单个需求文档的用例写入输出目录：<doc_id>.md、<doc_id>.xlsx 等，formats为导出格式（见exporter.EXPORT_FORMATS）
+def write_outputs(output_dir, doc_id, case_list, formats=("md", "xlsx")):
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    for fmt in formats:
+        path = os.path.join(output_dir, f"{doc_id}.{fmt}")
+        with open(path, 'wb') as f:
+            f.write(export_cases(case_list, fmt))
+        paths.append(path)
+    return paths
+
+
+# 批量生成：prds为[{"id": ..., "prd": ..., "test_case_count_range": (可选)}]，
+# 用信号量限制同时进行的对话组数量，单个文档失败不影响其他文档；
+# 每个文档的耗时和token统计写入指标日志（metrics.METRICS_DIR）；
+# incremental为True时以文档id为标识增量生成，结果中的diff为章节对比结果
+async def run_batch(prds, gen_role, review_role, output_dir, concurrency=4, test_case_count_range=(0, 0),
+                    section_tokens=0, policy=None, fanout=None, formats=("md", "xlsx"), dedupe_threshold=0,
+                    manual_batches=None, incremental=False, on_done=None):
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def run_one(item):
+        async with semaphore:
+            summary = {"id": item["id"], "cases": 0, "duplicates": 0, "error": None, "diff": None}
+            metrics = create_run_metrics(gen_role, review_role, label=item["id"])
+            try:
+                _, case_list = await run_prd(item["prd"], gen_role, review_role,
+                                             item.get("test_case_count_range", test_case_count_range),
+                                             section_tokens=section_tokens, metrics=metrics, policy=policy,
+                                             fanout=fanout, manual_batches=manual_batches,
+                                             incremental_id=item["id"] if incremental else None,
+                                             on_diff=lambda diff: summary.update(diff=diff),
+                                             dedupe_threshold=dedupe_threshold,
+                                             on_duplicates=lambda count: summary.update(duplicates=count))
+                # 导出在线程中执行，不阻塞其他文档的模型输出
+                await asyncio.to_thread(write_outputs, output_dir, item["id"], case_list, formats)
+                summary["cases"] = len(data_rows(case_list))
+            except Exception as e:
+                summary["error"] = str(e)
+            metrics.finish()
+            metrics.write_log()
+            summary["metrics"] = metrics.to_dict()
+            if on_done is not None:
+                on_done(summary)
+            return summary
+
+    return await asyncio.gather(*(run_one(item) for item in prds))
@@ -0,0 +1,226 @@
+import asyncio
+import os
+import re
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+import cv2
+import numpy as np
+import pymupdf
+from docx import Document
+from docx.table import Table
+from PIL import Image as PILImage
+from autogen_core import Image
+from autogen_core.models import SystemMessage, UserMessage
+from clients import create_model_client
+
+
+# 需求文档解析：txt/md直接读取；pdf按页在进程池中并行提取文字和图片；docx按段落和表格顺序提取；
+# 图片先过滤掉图标等小图，再按感知哈希（aHash）去掉重复的截图并缩小尺寸，
+# 文字中用“【图片n】”标记图片所在的位置，只有图片会交给文档解析模型（需要支持图片输入），
+# 解析结果替换回对应的标记处
+TEXT_SUFFIXES = ("txt", "md")
+IMAGE_SUFFIXES = ("png", "jpg", "jpeg", "bmp", "webp")
+PRD_SUFFIXES = TEXT_SUFFIXES + ("pdf", "docx") + IMAGE_SUFFIXES
+
+# 每个进程一次处理的pdf页数
+PAGES_PER_TASK = 4
+# 宽或高小于此值的图片多为图标、项目符号，不需要解析
+MIN_IMAGE_SIDE = 64
+# 交给模型的图片最长边，截图缩小到这个尺寸仍能看清文字
+MAX_IMAGE_SIDE = 1024
+# 两张图片的aHash相差不超过这么多位时视为同一张图片
+HASH_DISTANCE = 5
+# 页面文字少于此字数时视为扫描件，整页渲染成图片交给模型
+SCANNED_PAGE_CHARS = 20
+DEFAULT_VISION_CONCURRENCY = 4
+
+IMAGE_PLACEHOLDER = "【图片{index}】"
+PLACEHOLDER_PATTERN = re.compile(r'【图片(\d+)】')
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=min(os.cpu_count() or 1, 8))
+    return _executor
+
+
+# 过滤小图、计算aHash并缩小图片，返回 {"hash", "data"}，无法识别、过小或空白的图片返回None（在子进程中执行）
+def prepare_image(data):
+    gray = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_GRAYSCALE)
+    if gray is None or min(gray.shape) < MIN_IMAGE_SIDE or gray.std() < 2:
+        return None
+    small = cv2.resize(gray, (8, 8), interpolation=cv2.INTER_AREA)
+    image_hash = int.from_bytes(np.packbits(small > small.mean()).tobytes(), "big")
+    image = PILImage.open(BytesIO(data))
+    image.thumbnail((MAX_IMAGE_SIDE, MAX_IMAGE_SIDE))
+    output = BytesIO()
+    image.convert("RGB").save(output, format="JPEG", quality=85)
+    return {"hash": image_hash, "data": output.getvalue()}
+
+
+# 提取pdf第start到end-1页的文字和图片（在子进程中执行）
+def _extract_pdf_pages(path, start, end):
+    pages = []
+    seen_xrefs = set()
+    with pymupdf.open(path) as doc:
+        for number in range(start, end):
+            page = doc[number]
+            text = page.get_text("text").strip()
+            if len(text) < SCANNED_PAGE_CHARS:
+                zoom = min(2.0, MAX_IMAGE_SIDE / max(page.rect.width, page.rect.height, 1))
+                raw_images = [page.get_pixmap(matrix=pymupdf.Matrix(zoom, zoom)).tobytes("png")]
+            else:
+                raw_images = []
+                # 同一张图片（如页眉logo）在多页中引用时xref相同，只提取一次
+                for info in page.get_images(full=True):
+                    if info[0] not in seen_xrefs:
+                        seen_xrefs.add(info[0])
+                        raw_images.append(doc.extract_image(info[0])["image"])
+            images = [image for image in map(prepare_image, raw_images) if image is not None]
+            pages.append({"page": number + 1, "text": text, "images": images})
+    return pages
+
+
+def _extract_pdf(data):
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as f:
+        f.write(data)
+        path = f.name
+    try:
+        with pymupdf.open(path) as doc:
+            page_count = doc.page_count
+        ranges = [(start, min(start + PAGES_PER_TASK, page_count)) for start in range(0, page_count, PAGES_PER_TASK)]
+        futures = [get_executor().submit(_extract_pdf_pages, path, start, end) for start, end in ranges]
+        return [page for future in futures for page in future.result()]
+    finally:
+        os.remove(path)
+
+
+def _docx_table_text(table):
+    rows = []
+    for row in table.rows:
+        rows.append("| " + " | ".join(cell.text.strip().replace("\n", "<br>") for cell in row.cells) + " |")
+    return "\n".join(rows)
+
+
+# docx没有分页，整篇作为一页；图片放在所在段落之后
+def _extract_docx(data):
+    document = Document(BytesIO(data))
+    related_parts = document.part.related_parts
+    blocks = []
+    raw_images = []
+    for element in document.element.body.iterchildren():
+        if element.tag.endswith("}p"):
+            text = "".join(node.text or "" for node in element.iter() if node.tag.endswith("}t")).strip()
+            if text:
+                blocks.append(text)
+            for rel_id in element.xpath('.//a:blip/@r:embed'):
+                if rel_id in related_parts:
+                    blocks.append(len(raw_images))
+                    raw_images.append(related_parts[rel_id].blob)
+        elif element.tag.endswith("}tbl"):
+            blocks.append(_docx_table_text(Table(element, document)))
+    prepared = list(get_executor().map(prepare_image, raw_images)) if raw_images else []
+    # 文字和图片按原有顺序排列，图片用在images中的下标占位
+    images = []
+    parts = []
+    for block in blocks:
+        if isinstance(block, int):
+            if prepared[block] is not None:
+                parts.append(len(images))
+                images.append(prepared[block])
+        else:
+            parts.append(block)
+    return [{"page": 1, "text": "", "images": images, "parts": parts}]
+
+
+# 去掉重复的图片并为保留的图片编号，返回 (带图片标记的文字, [{"index", "page", "data"}])
+def _assemble(pages):
+    kept = []
+    texts = []
+
+    def place(image, page):
+        for other in kept:
+            if bin(image["hash"] ^ other["hash"]).count("1") <= HASH_DISTANCE:
+                return ""
+        kept.append({"index": len(kept) + 1, "page": page, "hash": image["hash"], "data": image["data"]})
+        return IMAGE_PLACEHOLDER.format(index=len(kept))
+
+    for page in pages:
+        if "parts" in page:
+            for part in page["parts"]:
+                texts.append(place(page["images"][part], page["page"]) if isinstance(part, int) else part)
+        else:
+            texts.append(page["text"])
+            texts.extend(place(image, page["page"]) for image in page["images"])
+    text = "\n".join(t for t in texts if t)
+    return text, [{key: image[key] for key in ("index", "page", "data")} for image in kept]
+
+
+# 提取文档中的文字和图片，返回 {"text": 带图片标记的文字, "images": [{"index", "page", "data"}]}
+def extract_document(data, name):
+    suffix = os.path.splitext(name)[1].lower().lstrip(".")
+    if suffix in TEXT_SUFFIXES:
+        return {"text": data.decode("utf-8", "ignore"), "images": []}
+    if suffix == "pdf":
+        pages = _extract_pdf(data)
+    elif suffix == "docx":
+        pages = _extract_docx(data)
+    elif suffix in IMAGE_SUFFIXES:
+        image = prepare_image(data)
+        pages = [{"page": 1, "text": "", "images": [image] if image else []}]
+    else:
+        raise ValueError(f"不支持的需求文档格式：{suffix}")
+    text, images = _assemble(pages)
+    return {"text": text, "images": images}
+
+
+def supports_vision(role):
+    return bool(role["config"][role["model_select"]]["model_info"].get("vision"))
+
+
+# 并发地把图片交给文档解析模型，返回 {图片编号: 解析结果}；单张图片失败不影响其他图片
+async def describe_images(images, analysis_role, concurrency=DEFAULT_VISION_CONCURRENCY, on_result=None):
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    model_client = create_model_client(analysis_role["config"], analysis_role["model_select"],
+                                       analysis_role.get("use_cache", False))
+
+    async def describe(image):
+        async with semaphore:
+            content = [f"以下是需求文档第{image['page']}页中的图片，请解析其中与需求相关的内容",
+                       Image.from_pil(PILImage.open(BytesIO(image["data"])))]
+            try:
+                result = await model_client.create([SystemMessage(content=analysis_role["prompt"]),
+                                                    UserMessage(content=content, source="user")])
+                description = result.content if isinstance(result.content, str) else str(result.content)
+            except Exception as e:
+                description = f"（图片解析失败：{e}）"
+            if on_result is not None:
+                on_result(image, description)
+            return image["index"], description.strip()
+
+    try:
+        return dict(await asyncio.gather(*(describe(image) for image in images)))
+    finally:
+        await model_client.close()
+
+
+# 把图片标记替换为解析结果，没有解析结果的标记直接去掉
+def fill_image_descriptions(text, descriptions):
+    def replace(match):
+        description = descriptions.get(int(match.group(1)))
+        return f"【图片{match.group(1)}：{description}】" if description else ""
+
+    return PLACEHOLDER_PATTERN.sub(replace, text)
+
+
+# 解析需求文档，返回交给编写用例模型的文字；传入analysis_role（且模型支持图片输入）时解析文档中的图片
+async def parse_prd(data, name, analysis_role=None, concurrency=DEFAULT_VISION_CONCURRENCY):
+    document = await asyncio.get_running_loop().run_in_executor(None, extract_document, data, name)
+    descriptions = {}
+    if analysis_role is not None and document["images"] and supports_vision(analysis_role):
+        descriptions = await describe_images(document["images"], analysis_role, concurrency)
+    return fill_image_descriptions(document["text"], descriptions)
@@ -0,0 +1,50 @@
+from cases import CASE_ROW_PATTERN, is_header_row, is_separator_row
+
+
+# 增量解析模型输出中的用例表格行：每收到一段文本就把已经结束（遇到换行）的表格行取出来，
+# 不必等整个对话结束后再对完整输出做一次正则匹配。
+# rows 与 format_testcases(完整输出) 的结果一致：包含表头、分隔行，去掉完全重复的行并保持顺序。
+class CaseRowParser:
+    def __init__(self, on_rows=None):
+        # on_rows(rows)在解析出新的用例数据行（不含表头和分隔行）时被调用
+        self.on_rows = on_rows
+        self.rows = []
+        self._seen = set()
+        self._buffer = ""
+
+    # 输入流式输出的一段文本，返回新解析出的用例数据行
+    def feed(self, text):
+        self._buffer += text
+        if "\n" not in text:
+            return []
+        lines = self._buffer.split("\n")
+        self._buffer = lines.pop()
+        return self._parse_lines(lines)
+
+    # 一条完整的模型发言：丢弃流式阶段未结束的半行，用完整内容补齐（已解析过的行会被去重）
+    def feed_message(self, content):
+        self._buffer = ""
+        return self._parse_lines(content.split("\n"))
+
+    # 对话结束时处理缓冲区中剩余的最后一行
+    def flush(self):
+        lines = [self._buffer]
+        self._buffer = ""
+        return self._parse_lines(lines)
+
+    def _parse_lines(self, lines):
+        new_rows = []
+        for line in lines:
+            match = CASE_ROW_PATTERN.search(line)
+            if not match:
+                continue
+            row = match.group(1)
+            if row in self._seen:
+                continue
+            self._seen.add(row)
+            self.rows.append(row)
+            if not is_separator_row(row) and not is_header_row(row):
+                new_rows.append(row)
+        if new_rows and self.on_rows is not None:
+            self.on_rows(new_rows)
+        return new_rows
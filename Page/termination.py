@@ -0,0 +1,83 @@
+from autogen_agentchat.base import TerminatedException, TerminationCondition
+from autogen_agentchat.conditions import TextMentionTermination, TokenUsageTermination
+from autogen_agentchat.messages import StopMessage, TextMessage
+from cases import data_rows, split_case_row
+from stream_parser import CaseRowParser
+
+
+# 生成->评审 对话的终止策略：
+#   max_turns：最多进行的发言轮数
+#   max_total_tokens：整个对话最多消耗的token数（输入+输出），0表示不限制
+#   timeout：整个对话最长耗时（秒），超时后立即停止并保留已生成的用例，0表示不限制
+#   convergence：编写用例模型修改后没有新增任何用例时提前结束，不再进行多余的评审
+#   compact_history：发给模型的历史中只保留最新一版完整的用例表格，之前的版本替换为摘要，见compaction.py
+DEFAULT_TERMINATION_POLICY = {
+    "max_turns": 10,
+    "max_total_tokens": 0,
+    "timeout": 0,
+    "convergence": True,
+    "compact_history": True,
+}
+
+GEN_SOURCE = "gen_cases_model"
+REVIEW_SOURCE = "review_cases_model"
+
+
+def resolve_policy(policy=None):
+    return {**DEFAULT_TERMINATION_POLICY, **(policy or {})}
+
+
+# 用例内容（不含用例ID）相同即视为同一条用例，修改时重新编号不会被当成新增用例
+def case_keys(content):
+    parser = CaseRowParser()
+    parser.feed_message(content)
+    return {tuple(split_case_row(row)[1:]) for row in data_rows(parser.rows)}
+
+
+# 收敛判断：编写用例模型第二次及之后给出的用例表格中，如果没有出现之前未出现过的用例，则结束对话。
+# 终止条件每次只会收到新增的消息，所以需要自己记录出现过的用例
+class ConvergenceTermination(TerminationCondition):
+    def __init__(self, source=GEN_SOURCE):
+        self._source = source
+        self._seen = set()
+        self._revisions = 0
+        self._terminated = False
+
+    @property
+    def terminated(self):
+        return self._terminated
+
+    async def __call__(self, messages):
+        if self._terminated:
+            raise TerminatedException("Termination condition has already been reached")
+        for message in messages:
+            if not isinstance(message, TextMessage) or message.source != self._source:
+                continue
+            keys = case_keys(message.content)
+            # 没有用例表格的发言（如“好的，我将按评审意见修改”）不算一次修改
+            if not keys:
+                continue
+            self._revisions += 1
+            if self._revisions > 1 and keys <= self._seen:
+                self._terminated = True
+                return StopMessage(content="本轮修改没有新增用例，对话已收敛", source="ConvergenceTermination")
+            self._seen |= keys
+        return None
+
+    async def reset(self):
+        self._seen = set()
+        self._revisions = 0
+        self._terminated = False
+
+
+# 根据终止策略组合终止条件（任一条件满足即结束）；
+# 发言轮数由RoundRobinGroupChat的max_turns控制，超时由调用方控制，见 pipeline.gen_review_testcases
+def build_termination(policy=None):
+    policy = resolve_policy(policy)
+    # 只认评审模型的APPROVE，避免编写用例模型的发言中提到APPROVE时误判
+    termination = TextMentionTermination("APPROVE", sources=[REVIEW_SOURCE])
+    if policy["max_total_tokens"]:
+        termination = termination | TokenUsageTermination(max_total_token=policy["max_total_tokens"])
+    if policy["convergence"]:
+        termination = termination | ConvergenceTermination()
+    return termination
@@ -1,5 +1,12 @@
 import streamlit as st
-import json
+import pandas as pd
+import time
+from io import BytesIO
+from exporter import EXPORT_FORMATS, export_cases, cases_to_frame
+from ingest import read_manual_cases
+from prd_parser import extract_document
+from config_store import update_json
+from jobs import ACTIVE_STATUSES, DONE, FAILED, STATUS_NAMES, cancel_job, get_job, list_jobs
 
 
 # 定义一个函数来处理模型参数设置
@@ -48,7 +55,11 @@ def model_param_section(title, config_value, col_widths=None, key_prefix="", mod
 # 定义一个函数来保存模型参数设置
 def save_model_config(config_dict, filepath, model_select, api_key, base_url, model, base_url_list,
                       model_list, max_tokens, temperature, top_p):
+    # 页面上没有的配置项（如max_concurrency、文档解析模型的vision）保留配置文件中原有的值
+    conf = config_dict.get(model_select, {})
+    model_info = conf.get("model_info", {})
     config_dict[model_select] = {
+        **conf,
         'api_key': api_key,
         'base_url': base_url,
         'model': model,
@@ -56,18 +67,133 @@ def save_model_config(config_dict, filepath, model_select, api_key, base_url, mo
         'model_list': model_list,
         "model_info": {
             "name": "deepseek-chat",
-            "parameters": {
-                "max_tokens": max_tokens,
-                "temperature": temperature,
-                "top_p": top_p
-            },
             "family": "deepseek",
             "functions": [],
             "vision": False,
             "json_output": True,
             "function_calling": True,
-            "structured_output": True
+            "structured_output": True,
+            **model_info,
+            "parameters": {
+                **model_info.get("parameters", {}),
+                "max_tokens": max_tokens,
+                "temperature": temperature,
+                "top_p": top_p
+            }
         }
     }
-    with open(filepath, 'w', encoding='utf-8') as f:
-        json.dump(config_dict, f, indent=4)
+    # 只替换当前模型厂商的配置，其他厂商的配置以文件中最新的内容为准
+    update_json(filepath, lambda config: config.__setitem__(model_select, config_dict[model_select]))
+
+
+# 后台任务的轮询间隔（秒）
+JOB_POLL_INTERVAL = 1.0
+
+
+# 导出结果按用例内容缓存，页面重新运行（如点击下载按钮）时不再重复生成文件
+@st.cache_data(max_entries=32, show_spinner=False)
+def cached_export(case_list, fmt):
+    return export_cases(case_list, fmt)
+
+
+# 上传的人工测试用例只在文件变化时重新解析，页面的每次重新运行都直接复用
+@st.cache_data(max_entries=4, show_spinner="正在读取人工测试用例...")
+def load_manual_cases(data, name):
+    return read_manual_cases(BytesIO(data), name)
+
+
+# 上传的需求文档只在文件变化时重新提取文字和图片
+@st.cache_data(max_entries=4, show_spinner="正在解析需求文档...")
+def load_prd_document(data, name):
+    return extract_document(data, name)
+
+
+# 各格式的下载按钮
+def download_buttons(case_list, on_click=None, args=None, key_prefix="download"):
+    icons = {"md": ":material/markdown:", "xlsx": ":material/download:",
+             "csv": ":material/table:", "json": ":material/data_object:"}
+    cols = st.columns(len(EXPORT_FORMATS))
+    for col, (fmt, (_, mime)) in zip(cols, EXPORT_FORMATS.items()):
+        col.download_button(
+            label=f"下载测试用例(.{fmt})",
+            data=cached_export(case_list, fmt),
+            file_name=f"测试用例.{fmt}",
+            mime=mime,
+            icon=icons[fmt],
+            on_click=on_click,
+            args=args,
+            key=f"{key_prefix}_{fmt}",
+        )
+
+
+# 显示一次运行的耗时和token统计
+def show_metrics(metrics):
+    # 后台任务的统计以字典形式保存在任务记录中
+    data = metrics if isinstance(metrics, dict) else metrics.to_dict()
+    with st.expander(f"**运行统计**（总耗时 {data['wall_time']:.1f}s，输入 {data['prompt_tokens']} tokens，"
+                     f"输出 {data['completion_tokens']} tokens）"):
+        if data["stop_reason"]:
+            st.markdown(f"结束原因：{data['stop_reason']}")
+        st.dataframe(pd.DataFrame(data["summary"]), hide_index=True)
+        st.dataframe(pd.DataFrame(data["turns"]), hide_index=True)
+
+
+# 后台任务的进度和结果。任务未结束时只有这一部分每隔JOB_POLL_INTERVAL秒重新运行，
+# 显示已解析出的用例和模型发言；任务结束后整页重新运行一次，停止轮询
+def show_job(job_id, key_prefix="job"):
+    job = get_job(job_id)
+    if job is None:
+        st.warning(f"任务 {job_id} 不存在")
+        return
+    active = job["status"] in ACTIVE_STATUSES
+
+    @st.fragment(run_every=JOB_POLL_INTERVAL if active else None)
+    def job_view():
+        job = get_job(job_id)
+        if active and job["status"] not in ACTIVE_STATUSES:
+            st.rerun()
+        if job["status"] in ACTIVE_STATUSES:
+            elapsed = time.time() - (job["started"] or job["created"])
+            progress = f"，{job['progress']}" if job["progress"] else ""
+            st.info(f"任务 {job_id}（{job['label']}）：{STATUS_NAMES[job['status']]}{progress}，已用时 {elapsed:.0f}s")
+            if st.button("取消任务", key=f"{key_prefix}_cancel_{job_id}"):
+                cancel_job(job_id)
+            if job["rows"]:
+                st.dataframe(cases_to_frame(job["rows"]), hide_index=True)
+            with st.expander("**模型输出**", expanded=True):
+                st.markdown(job["output"] + job["partial"])
+        elif job["status"] == DONE:
+            st.success("✅ 测试用例生成完成!")
+            if job["duplicates"]:
+                st.info(f"已去掉 {job['duplicates']} 条近似重复的用例")
+            if job["outcomes"]:
+                st.dataframe(pd.DataFrame(job["outcomes"]), hide_index=True)
+            st.dataframe(cases_to_frame(job["case_list"]), hide_index=True)
+            with st.expander("**模型输出**"):
+                st.markdown(job["response"])
+            show_metrics(job["metrics"])
+            if job["case_list"]:
+                download_buttons(job["case_list"], key_prefix=f"{key_prefix}_download_{job_id}")
+        elif job["status"] == FAILED:
+            st.error(f"生成测试用例时出错: {job['error']}")
+        else:
+            st.warning(f"任务 {job_id} 已取消")
+
+    job_view()
+
+
+# 生成任务列表，可选择其中一个任务查看进度和结果
+def show_job_list():
+    jobs = list_jobs()
+    if not jobs:
+        st.write("暂无生成任务")
+        return
+    frame = pd.DataFrame(jobs)
+    frame["status"] = frame["status"].map(STATUS_NAMES)
+    for column in ("created", "started", "finished"):
+        frame[column] = frame[column].map(
+            lambda t: time.strftime("%m-%d %H:%M:%S", time.localtime(t)) if pd.notna(t) else "")
+    st.dataframe(frame, hide_index=True)
+    job_id = st.selectbox("**查看任务**", options=[job["id"] for job in jobs],
+                          format_func=lambda x: next(f"{x}（{job['label']}）" for job in jobs if job["id"] == x))
+    show_job(job_id, key_prefix="job_list")
@@ -0,0 +1,173 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+
+# 流水线相关模块放在Page目录下，与页面共用
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(ROOT_DIR, "Page"))
+
+from pipeline import run_batch  # noqa: E402
+from termination import DEFAULT_TERMINATION_POLICY  # noqa: E402
+from exporter import EXPORT_FORMATS  # noqa: E402
+from dedup import DEFAULT_THRESHOLD  # noqa: E402
+from fanout import DEFAULT_FANOUT_TIMEOUT, FANOUT_MODES, parse_candidates  # noqa: E402
+from ingest import DEFAULT_MANUAL_BATCH_TOKENS, manual_case_batches, read_manual_cases  # noqa: E402
+from prd_parser import PRD_SUFFIXES, parse_prd, supports_vision  # noqa: E402
+import config_store  # noqa: E402
+from client_pool import close_all, run_coroutine  # noqa: E402
+from incremental import describe_diff  # noqa: E402
+
+TEMPLATES_DIR = os.path.join(ROOT_DIR, "Templates")
+
+
+def load_json(filename):
+    return config_store.load_json(os.path.join(TEMPLATES_DIR, filename))
+
+
+def load_text(filename):
+    return config_store.load_text(os.path.join(TEMPLATES_DIR, filename))
+
+
+# 并发解析多个需求文档，同时解析的文档数由concurrency限制（每个文档中的图片另有并发限制）
+async def parse_prd_files(paths, analysis_role=None, concurrency=4):
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def parse(path):
+        async with semaphore:
+            with open(path, 'rb') as f:
+                data = f.read()
+            return await parse_prd(data, os.path.basename(path), analysis_role)
+
+    return await asyncio.gather(*(parse(path) for path in paths))
+
+
+# 读取需求文档：目录下的每个txt/md/pdf/docx/图片文件是一个需求文档，传入analysis_role时解析其中的图片；
+# jsonl文件每行是一个需求文档：{"id": "文档标识", "prd": "需求内容", "test_case_count_range": [最少, 最多]（可选）}
+def load_prds(path, analysis_role=None, concurrency=4):
+    prds = []
+    if os.path.isdir(path):
+        names = [name for name in sorted(os.listdir(path))
+                 if os.path.splitext(name)[1].lower().lstrip(".") in PRD_SUFFIXES]
+        texts = run_coroutine(parse_prd_files([os.path.join(path, name) for name in names], analysis_role,
+                                              concurrency))
+        for name, prd in zip(names, texts):
+            # 同名不同格式的文档（如a.pdf和a.docx）用完整文件名区分，避免输出文件互相覆盖
+            doc_id = os.path.splitext(name)[0]
+            if any(item["id"] == doc_id for item in prds):
+                doc_id = name.replace(".", "_")
+            prds.append({"id": doc_id, "prd": prd})
+    else:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line_no, line in enumerate(f, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                item = json.loads(line)
+                item.setdefault("id", f"prd_{line_no}")
+                prds.append(item)
+    return prds
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批量为需求文档生成并评审测试用例")
+    parser.add_argument("input", help="需求文档（txt/md/pdf/docx/图片）所在目录，或每行一个需求文档的jsonl文件")
+    parser.add_argument("-o", "--output-dir", default=os.path.join(ROOT_DIR, "Output"), help="用例输出目录")
+    parser.add_argument("-c", "--concurrency", type=int, default=4, help="同时进行的对话组数量")
+    parser.add_argument("--min-cases", type=int, default=0, help="最少生成的用例数量")
+    parser.add_argument("--max-cases", type=int, default=0, help="最多生成的用例数量")
+    parser.add_argument("--gen-model", default="deepseek", help="编写用例使用的模型配置名")
+    parser.add_argument("--review-model", default="deepseek", help="评审用例使用的模型配置名")
+    parser.add_argument("--section-tokens", type=int, default=0,
+                        help="大于0时按章节分段并行生成，每段最多包含的token数（建议1500）")
+    parser.add_argument("--max-turns", type=int, default=DEFAULT_TERMINATION_POLICY["max_turns"],
+                        help="每个对话组最多进行的发言轮数")
+    parser.add_argument("--max-total-tokens", type=int, default=DEFAULT_TERMINATION_POLICY["max_total_tokens"],
+                        help="每个对话组最多消耗的token数，0表示不限制")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TERMINATION_POLICY["timeout"],
+                        help="每个对话组的最长耗时（秒），0表示不限制")
+    parser.add_argument("--no-convergence", action="store_true", help="修改后没有新增用例时不提前结束")
+    parser.add_argument("--no-compact-history", action="store_true",
+                        help="多轮评审时把每一版完整的用例表格都发给模型（默认只保留最新一版，之前的替换为摘要）")
+    parser.add_argument("--fanout", default="",
+                        help="多模型并行生成，逗号分隔的候选模型，如 deepseek:deepseek-chat,deepseek:deepseek-reasoner")
+    parser.add_argument("--fanout-mode", choices=FANOUT_MODES, default="best",
+                        help="best：取评审得分最高的一份；union：合并全部模型的用例")
+    parser.add_argument("--fanout-timeout", type=float, default=DEFAULT_FANOUT_TIMEOUT, help="每个候选模型的最长耗时（秒）")
+    parser.add_argument("--formats", default="md,xlsx", help=f"逗号分隔的导出格式，可选：{','.join(EXPORT_FORMATS)}")
+    parser.add_argument("--dedupe", action="store_true", help="去掉近似重复的用例（默认不去重）")
+    parser.add_argument("--dedupe-threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="近似重复用例的相似度阈值，与--dedupe一起使用")
+    parser.add_argument("--manual-cases", default="",
+                        help="人工测试用例文件（xlsx/csv/txt/json），评审时与生成的用例对照")
+    parser.add_argument("--manual-batch-tokens", type=int, default=DEFAULT_MANUAL_BATCH_TOKENS,
+                        help="人工测试用例每批交给评审模型的token数")
+    parser.add_argument("--analyze-images", action="store_true",
+                        help="用文档解析模型解析pdf/docx/图片中的图片（模型需要支持图片输入）")
+    parser.add_argument("--analysis-model", default="deepseek", help="文档解析使用的模型配置名")
+    parser.add_argument("--incremental", action="store_true",
+                        help="增量生成：与同一文档id上一次增量生成时的需求文档按章节对比，只重新生成有变化的章节")
+    parser.add_argument("--no-cache", action="store_true", help="不使用模型回复的磁盘缓存")
+    args = parser.parse_args()
+    # 导出格式在生成前检查，避免模型调用完成后才因格式错误失败
+    formats = [fmt.strip() for fmt in args.formats.split(",") if fmt.strip()]
+    unknown = [fmt for fmt in formats if fmt not in EXPORT_FORMATS]
+    if unknown or not formats:
+        parser.error(f"不支持的导出格式：{','.join(unknown)}，可选：{','.join(EXPORT_FORMATS)}")
+
+    analysis_role = None
+    if args.analyze_images:
+        analysis_role = {"config": load_json("analysis_prd_model_config.json"), "model_select": args.analysis_model,
+                         "prompt": load_text("analysis_prd_model_prompt.txt"), "use_cache": not args.no_cache}
+        if not supports_vision(analysis_role):
+            print("文档解析模型未开启图片输入（model_info中的vision），文档中的图片不会被解析")
+    prds = load_prds(args.input, analysis_role, args.concurrency)
+    if not prds:
+        print(f"未找到需求文档：{args.input}")
+        return 1
+
+    gen_role = {"config": load_json("gen_cases_model_config.json"), "model_select": args.gen_model,
+                "prompt": load_text("gen_cases_model_prompt.txt"), "use_cache": not args.no_cache}
+    review_role = {"config": load_json("review_cases_model_config.json"), "model_select": args.review_model,
+                   "prompt": load_text("review_cases_model_prompt.txt"), "use_cache": not args.no_cache}
+
+    manual_batches = []
+    if args.manual_cases:
+        manual_batches = manual_case_batches(read_manual_cases(args.manual_cases), args.manual_batch_tokens)
+        print(f"人工测试用例分为 {len(manual_batches)} 批")
+
+    def on_done(summary):
+        if summary["error"]:
+            print(f"[失败] {summary['id']}: {summary['error']}")
+        else:
+            metrics = summary["metrics"]
+            if summary["diff"] is not None:
+                print(f"[增量] {summary['id']}: {describe_diff(summary['diff'])}")
+            print(f"[完成] {summary['id']}: {summary['cases']} 行用例（去重 {summary['duplicates']} 条），耗时 {metrics['wall_time']}s，"
+                  f"输入 {metrics['prompt_tokens']} tokens，输出 {metrics['completion_tokens']} tokens")
+
+    summaries = run_coroutine(run_batch(prds, gen_role, review_role, args.output_dir,
+                                        concurrency=args.concurrency,
+                                        test_case_count_range=(args.min_cases, args.max_cases),
+                                        section_tokens=args.section_tokens,
+                                        policy={"max_turns": args.max_turns,
+                                                "max_total_tokens": args.max_total_tokens,
+                                                "timeout": args.timeout,
+                                                "convergence": not args.no_convergence,
+                                                "compact_history": not args.no_compact_history},
+                                        fanout={"candidates": parse_candidates(args.fanout), "mode": args.fanout_mode,
+                                                "timeout": args.fanout_timeout},
+                                        dedupe_threshold=args.dedupe_threshold if args.dedupe else 0,
+                                        manual_batches=manual_batches,
+                                        incremental=args.incremental,
+                                        formats=formats,
+                                        on_done=on_done))
+    close_all()
+    failed = [s for s in summaries if s["error"]]
+    print(f"共 {len(summaries)} 个需求文档，成功 {len(summaries) - len(failed)} 个，失败 {len(failed)} 个")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,302 @@
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import sys
+
+# 流水线相关模块放在Page目录下，与页面共用
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(ROOT_DIR, "Page"))
+
+import uvicorn  # noqa: E402
+from mcp.server.mcpserver import Context, MCPServer  # noqa: E402
+from starlette.applications import Starlette  # noqa: E402
+from starlette.responses import JSONResponse, StreamingResponse  # noqa: E402
+from starlette.routing import Mount, Route  # noqa: E402
+from pipeline import create_run_metrics, run_prd  # noqa: E402
+from termination import DEFAULT_TERMINATION_POLICY  # noqa: E402
+from dedup import DEFAULT_THRESHOLD  # noqa: E402
+from cases import cases_to_markdown  # noqa: E402
+from fanout import DEFAULT_FANOUT_TIMEOUT, FANOUT_MODES, parse_candidates  # noqa: E402
+from ingest import DEFAULT_MANUAL_BATCH_TOKENS, manual_case_batches  # noqa: E402
+import config_store  # noqa: E402
+from client_pool import close_all, run_on_pool  # noqa: E402
+
+# 生成-评审流水线的HTTP/MCP服务，供CI等外部系统调用：
+# POST /generate 以NDJSON流式返回用例行，每解析出新的用例行就返回一行事件，最后返回完整的用例和指标；
+# /mcp 下是MCP（streamable HTTP）服务，提供generate_test_cases工具，也可以用--stdio以标准输入输出方式运行。
+# 流水线都在client_pool的后台事件循环中执行，与页面、命令行共用模型客户端的连接池；
+# 同时执行的生成数和排队数都有上限，排队已满时HTTP返回429，调用方按Retry-After稍后重试
+TEMPLATES_DIR = os.path.join(ROOT_DIR, "Templates")
+DEFAULT_MAX_RUNNING = 8
+DEFAULT_MAX_PENDING = 32
+# 排队已满时建议调用方等待的秒数
+RETRY_AFTER = 10
+
+
+def load_json(filename):
+    return config_store.load_json(os.path.join(TEMPLATES_DIR, filename))
+
+
+def load_text(filename):
+    return config_store.load_text(os.path.join(TEMPLATES_DIR, filename))
+
+
+# 限制同时执行的生成数（running）和已接收的请求总数（pending，含执行中和排队中的）
+class Backpressure:
+    def __init__(self, max_running=DEFAULT_MAX_RUNNING, max_pending=DEFAULT_MAX_PENDING):
+        self.max_running = max_running
+        self.max_pending = max(max_pending, max_running)
+        self.running = 0
+        self.pending = 0
+        self._semaphore = None
+
+    # 排队已满时返回False，调用方应拒绝请求
+    def enter(self):
+        if self.pending >= self.max_pending:
+            return False
+        self.pending += 1
+        return True
+
+    def leave(self):
+        self.pending -= 1
+
+    # 信号量在服务的事件循环中创建
+    @contextlib.asynccontextmanager
+    async def slot(self):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_running)
+        async with self._semaphore:
+            self.running += 1
+            try:
+                yield
+            finally:
+                self.running -= 1
+
+    def status(self):
+        return {"running": self.running, "queued": self.pending - self.running,
+                "max_running": self.max_running, "max_pending": self.max_pending}
+
+
+backpressure = Backpressure()
+
+
+def _int_range(value):
+    if not isinstance(value, (list, tuple)) or len(value) != 2:
+        raise ValueError("test_case_count_range应为 [最少, 最多]")
+    return int(value[0]), int(value[1])
+
+
+# 终止策略的各项（见termination.DEFAULT_TERMINATION_POLICY）按默认值的类型检查和转换，timeout可以是小数
+def _policy(body):
+    policy = {}
+    for key, default in DEFAULT_TERMINATION_POLICY.items():
+        value = body.get(key, default)
+        if isinstance(default, bool):
+            if not isinstance(value, bool):
+                raise ValueError(f"{key}应为true或false")
+        else:
+            try:
+                value = float(value) if key == "timeout" else int(value)
+            except (TypeError, ValueError):
+                raise ValueError(f"{key}应为数字：{value!r}")
+            if value < 0:
+                raise ValueError(f"{key}不能小于0")
+        policy[key] = value
+    if policy["max_turns"] < 1:
+        raise ValueError("max_turns应大于0")
+    return policy
+
+
+# 把请求参数整理为run_prd的参数，参数不合法时抛出ValueError
+def build_request(body):
+    if not isinstance(body, dict):
+        raise ValueError("请求体应为json对象")
+    prd = body.get("prd")
+    if not isinstance(prd, str) or not prd.strip():
+        raise ValueError("缺少需求文档内容prd")
+    use_cache = bool(body.get("use_cache", True))
+    gen_role = {"config": load_json("gen_cases_model_config.json"), "model_select": body.get("gen_model", "deepseek"),
+                "prompt": load_text("gen_cases_model_prompt.txt"), "use_cache": use_cache}
+    review_role = {"config": load_json("review_cases_model_config.json"),
+                   "model_select": body.get("review_model", "deepseek"),
+                   "prompt": load_text("review_cases_model_prompt.txt"), "use_cache": use_cache}
+    for role in (gen_role, review_role):
+        if role["model_select"] not in role["config"]:
+            raise ValueError(f"未配置的模型：{role['model_select']}")
+    policy = _policy(body)
+    fanout = None
+    if body.get("fanout"):
+        if not isinstance(body["fanout"], str):
+            raise ValueError("fanout应为逗号分隔的 模型厂商:模型名")
+        fanout = {"candidates": parse_candidates(body["fanout"]), "mode": body.get("fanout_mode", "best"),
+                  "timeout": float(body.get("fanout_timeout", DEFAULT_FANOUT_TIMEOUT))}
+        if fanout["mode"] not in FANOUT_MODES:
+            raise ValueError(f"fanout_mode应为 {'/'.join(FANOUT_MODES)}")
+    manual_batches = None
+    if body.get("manual_cases"):
+        if not isinstance(body["manual_cases"], str):
+            raise ValueError("manual_cases应为人工测试用例的文本")
+        manual_batches = manual_case_batches(body["manual_cases"].splitlines(),
+                                             int(body.get("manual_batch_tokens", DEFAULT_MANUAL_BATCH_TOKENS)))
+    return {
+        "label": str(body.get("id", "serve")),
+        "prd_inputs": prd,
+        "gen_role": gen_role,
+        "review_role": review_role,
+        "test_case_count_range": _int_range(body.get("test_case_count_range", (0, 0))),
+        "section_tokens": int(body.get("section_tokens", 0)),
+        "policy": policy,
+        "fanout": fanout,
+        "manual_batches": manual_batches,
+        # 近似重复用例去重需要显式开启
+        "dedupe_threshold": float(body.get("dedupe_threshold", DEFAULT_THRESHOLD)) if body.get("dedupe") else 0,
+        # 不为空时按该文档标识增量生成，只重新生成有变化的章节
+        "incremental_id": str(body["incremental_id"]) if body.get("incremental_id") else None,
+    }
+
+
+# 执行一次生成并逐个产出事件：{"event": "rows", "rows": [...]}、{"event": "message", ...}（with_messages时）、
+# 最后是 {"event": "done", ...} 或 {"event": "error", ...}。
+# 回调在后台事件循环的线程中触发，经队列转交给当前事件循环；调用方停止迭代（如客户端断开）时取消生成
+async def generate_events(request, with_messages=False):
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+
+    def put(event):
+        loop.call_soon_threadsafe(queue.put_nowait, event)
+
+    async def generate():
+        metrics = create_run_metrics(request["gen_role"], request["review_role"], label=request["label"])
+        duplicates = []
+        result, case_list = await run_prd(
+            request["prd_inputs"], request["gen_role"], request["review_role"],
+            test_case_count_range=request["test_case_count_range"], section_tokens=request["section_tokens"],
+            metrics=metrics, policy=request["policy"], fanout=request["fanout"],
+            manual_batches=request["manual_batches"], incremental_id=request["incremental_id"],
+            dedupe_threshold=request["dedupe_threshold"], on_duplicates=duplicates.append,
+            on_message=(lambda content: put({"event": "message", "content": content})) if with_messages else None,
+            on_rows=lambda rows: put({"event": "rows", "rows": rows}))
+        metrics.finish()
+        await asyncio.to_thread(metrics.write_log)
+        return case_list, sum(duplicates), metrics
+
+    async def run():
+        try:
+            case_list, duplicates, metrics = await run_on_pool(generate())
+            put({"event": "done", "case_list": case_list, "duplicates": duplicates,
+                 "stop_reason": metrics.stop_reason, "metrics": metrics.to_dict()})
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            put({"event": "error", "error": str(e)})
+        finally:
+            put(None)
+
+    task = asyncio.create_task(run())
+    try:
+        while (event := await queue.get()) is not None:
+            yield event
+    finally:
+        task.cancel()
+
+
+async def generate_endpoint(request):
+    try:
+        body = await request.json()
+    except ValueError:
+        return JSONResponse({"error": "请求体不是合法的json"}, status_code=400)
+    try:
+        generation = build_request(body)
+    except (ValueError, TypeError) as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    if not backpressure.enter():
+        return JSONResponse({"error": "服务繁忙，请稍后重试", **backpressure.status()}, status_code=429,
+                            headers={"Retry-After": str(RETRY_AFTER)})
+
+    async def stream():
+        try:
+            yield json.dumps({"event": "queued", **backpressure.status()}, ensure_ascii=False) + "\n"
+            async with backpressure.slot():
+                async for event in generate_events(generation, bool(body.get("messages"))):
+                    yield json.dumps(event, ensure_ascii=False) + "\n"
+        finally:
+            backpressure.leave()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
+async def health_endpoint(request):
+    return JSONResponse({"status": "ok", **backpressure.status()})
+
+
+mcp = MCPServer("LLM_Gen_TestCase")
+
+
+# MCPServer根据参数的类型注解生成工具的输入格式
+@mcp.tool(description="根据产品需求文档生成并评审测试用例，返回markdown表格；生成过程中以进度通知推送新增的用例行")
+async def generate_test_cases(prd: str, min_cases: int = 0, max_cases: int = 0, section_tokens: int = 0,
+                              gen_model: str = "deepseek", review_model: str = "deepseek",
+                              dedupe: bool = False, dedupe_threshold: float = DEFAULT_THRESHOLD,
+                              ctx: Context = None) -> str:
+    generation = build_request({"prd": prd, "test_case_count_range": [min_cases, max_cases],
+                                "section_tokens": section_tokens, "gen_model": gen_model,
+                                "review_model": review_model, "dedupe": dedupe,
+                                "dedupe_threshold": dedupe_threshold})
+    if not backpressure.enter():
+        raise RuntimeError(f"服务繁忙，请{RETRY_AFTER}秒后重试")
+    try:
+        async with backpressure.slot():
+            row_count = 0
+            async for event in generate_events(generation):
+                if event["event"] == "rows" and ctx is not None:
+                    row_count += len(event["rows"])
+                    await ctx.report_progress(row_count, message="\n".join(event["rows"]))
+                elif event["event"] == "error":
+                    raise RuntimeError(event["error"])
+                elif event["event"] == "done":
+                    return cases_to_markdown(event["case_list"])
+    finally:
+        backpressure.leave()
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    async with mcp.session_manager.run():
+        yield
+
+
+# host用于MCP服务的DNS重绑定防护，应与监听地址一致
+def create_app(host="127.0.0.1"):
+    return Starlette(routes=[
+        Route("/generate", generate_endpoint, methods=["POST"]),
+        Route("/health", health_endpoint, methods=["GET"]),
+        Mount("/mcp", app=mcp.streamable_http_app(streamable_http_path="/", stateless_http=True, host=host)),
+    ], lifespan=lifespan)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="以HTTP/MCP服务的方式提供测试用例生成")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址")
+    parser.add_argument("--port", type=int, default=8600, help="监听端口")
+    parser.add_argument("--max-running", type=int, default=DEFAULT_MAX_RUNNING, help="同时执行的生成数")
+    parser.add_argument("--max-pending", type=int, default=DEFAULT_MAX_PENDING,
+                        help="执行中和排队中的请求总数上限，超出时返回429")
+    parser.add_argument("--stdio", action="store_true", help="以标准输入输出方式运行MCP服务（供本地MCP客户端启动）")
+    args = parser.parse_args()
+
+    global backpressure
+    backpressure = Backpressure(args.max_running, args.max_pending)
+    try:
+        if args.stdio:
+            mcp.run()
+        else:
+            uvicorn.run(create_app(args.host), host=args.host, port=args.port)
+    finally:
+        close_all()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
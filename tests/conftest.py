@@ -0,0 +1,6 @@
+import os
+import sys
+
+
+# Page下的模块按扁平方式互相导入，与batch_run.py、serve.py一样把Page加入导入路径
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Page"))
@@ -0,0 +1,27 @@
+from cases import format_testcases
+from exporter import cases_to_frame
+from stream_parser import CaseRowParser
+
+OUTPUT = """| 用例ID | 用例标题 | 测试目标 | 前置条件 | 操作步骤 | 预期结果 | 优先级 | 测试类型 |
+|--------|--------|--------|--------|--------|--------|--------|--------|
+| DL_001 | 登录 | 验证登录 | 已注册 | 输入a\\|b | 登录成功 | P1 | 功能 |
+| DL_002 | 登录 | 验证登录 | 已注册 | 输入a|b | 登录成功 | P1 | 功能 |
+| DL_003 | 登录 | 验证登录 | 已注册 | 点击登录 | 登录成功 | P2 |
+"""
+
+
+def test_rows_with_other_column_counts_are_kept():
+    parser = CaseRowParser()
+    parser.feed(OUTPUT)
+    parser.flush()
+    assert parser.rows == format_testcases(OUTPUT)
+    assert len(parser.rows) == 5
+
+
+def test_frame_folds_extra_cells_and_unescapes_pipes():
+    frame = cases_to_frame(format_testcases(OUTPUT))
+    assert list(frame["用例ID"]) == ["DL_001", "DL_002", "DL_003"]
+    assert frame.loc[0, "操作步骤"] == "输入a|b"
+    # 未转义的“|”多拆出的单元格并回最后一列
+    assert frame.loc[1, "测试类型"].endswith("功能")
+    assert frame.loc[2, "测试类型"] == ""
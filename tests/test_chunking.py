@@ -0,0 +1,33 @@
+from chunking import chunk_prd, split_prd_sections
+
+
+def titles(prd):
+    return [section["title"] for section in split_prd_sections(prd)]
+
+
+def test_markdown_headings():
+    assert titles("# 登录\n用户可以登录。\n## 注册\n用户可以注册。") == ["登录", "注册"]
+
+
+def test_numbered_steps_are_not_headings():
+    prd = ("## 登录\n1. 输入用户名\n2. 输入密码\n"
+           "## 注册\n1. 输入手机号\n"
+           "## 找回密码\n1. 输入邮箱\n2. 点击发送")
+    sections = split_prd_sections(prd)
+    assert [section["title"] for section in sections] == ["登录", "注册", "找回密码"]
+    assert sections[0]["content"] == "## 登录\n1. 输入用户名\n2. 输入密码"
+
+
+def test_numbered_headings_followed_by_body():
+    prd = "1. 概述\n本系统用于登录。\n\n2. 登录\n用户输入账号密码。\n1、输入用户名\n2、点击登录\n3. 注册\n用户注册。"
+    assert titles(prd) == ["1. 概述", "2. 登录", "3. 注册"]
+
+
+def test_consecutive_headings_share_section():
+    assert titles("# 需求\n## 登录\n用户可以登录。") == ["登录"]
+
+
+def test_chunk_prd_merges_small_sections():
+    chunks = chunk_prd("# 登录\n用户可以登录。\n# 注册\n用户可以注册。", max_tokens=1000)
+    assert len(chunks) == 1
+    assert chunks[0]["title"] == "登录；注册"
@@ -0,0 +1,68 @@
+from cases import join_case_row
+from dedup import dedupe_testcases
+
+HEADER = ["| 用例ID | 用例标题 | 测试目标 | 前置条件 | 操作步骤 | 预期结果 | 优先级 | 测试类型 |",
+          "| -------- | -------- | -------- | -------- | -------- | -------- | -------- | -------- |"]
+
+# (a, b) 同一用例的不同说法
+PARAPHRASES = [
+    (["DL_001", "用户名为空时登录失败", "验证用户名必填校验", "已打开登录页面", "1. 用户名不填<br>2. 输入正确密码<br>3. 点击登录", "提示“请输入用户名”，登录失败", "P1", "异常"],
+     ["DL_007", "用户名为空时登录失败", "校验用户名为必填项", "登录页面已打开", "1. 不输入用户名<br>2. 填写正确的密码<br>3. 点击登录按钮", "页面提示请输入用户名，无法登录", "P1", "异常"]),
+    (["DL_002", "用户名为空时无法登录", "验证用户名不能为空", "已打开登录页面", "1. 用户名留空<br>2. 输入密码<br>3. 点击登录", "提示请输入用户名", "P1", "异常"],
+     ["DL_008", "用户名为空登录失败", "验证用户名为空时的校验", "已进入登录页", "1. 用户名不填写<br>2. 输入密码<br>3. 点击登录", "系统提示请输入用户名，登录失败", "P1", "异常"]),
+    (["DL_003", "正确的账号密码登录成功", "验证正常登录流程", "已注册账号", "1. 输入正确的用户名和密码<br>2. 点击登录", "登录成功，跳转到首页", "P0", "功能"],
+     ["DL_009", "使用正确账号和密码登录", "验证用户可以正常登录", "用户已注册", "1. 输入已注册的用户名及正确密码<br>2. 点击登录按钮", "成功登录并进入首页", "P0", "功能"]),
+    (["ZC_001", "手机号格式错误时注册失败", "验证手机号格式校验", "已打开注册页面", "1. 输入格式错误的手机号<br>2. 点击获取验证码", "提示手机号格式不正确", "P1", "异常"],
+     ["ZC_005", "输入格式不正确的手机号注册", "校验手机号格式", "注册页面已打开", "1. 填写格式错误的手机号码<br>2. 点击获取验证码按钮", "提示“手机号格式错误”，无法获取验证码", "P1", "异常"]),
+    (["ZH_001", "通过邮箱找回密码", "验证邮箱找回密码功能", "账号已绑定邮箱", "1. 点击忘记密码<br>2. 输入绑定的邮箱<br>3. 点击发送", "提示重置邮件已发送，邮箱收到重置链接", "P1", "功能"],
+     ["ZH_004", "使用邮箱找回密码", "验证可以通过邮箱重置密码", "用户已绑定邮箱", "1. 点击“忘记密码”<br>2. 填写绑定邮箱<br>3. 点击发送按钮", "提示邮件已发送，邮箱中收到重置密码链接", "P1", "功能"]),
+]
+# (a, b) 相似但不同的用例：正反例、不同字段、边界值
+DISTINCT = [
+    (["DL_001", "用户名为空时登录失败", "验证用户名必填校验", "已打开登录页面", "1. 用户名不填<br>2. 输入正确密码<br>3. 点击登录", "提示“请输入用户名”，登录失败", "P1", "异常"],
+     ["DL_002", "密码为空时登录失败", "验证密码必填校验", "已打开登录页面", "1. 输入正确用户名<br>2. 密码不填<br>3. 点击登录", "提示“请输入密码”，登录失败", "P1", "异常"]),
+    (["DL_003", "正确的账号密码登录成功", "验证正常登录流程", "已注册账号", "1. 输入正确的用户名和密码<br>2. 点击登录", "登录成功，跳转到首页", "P0", "功能"],
+     ["DL_004", "错误的密码登录失败", "验证密码错误时的处理", "已注册账号", "1. 输入正确的用户名和错误的密码<br>2. 点击登录", "提示用户名或密码错误，登录失败", "P1", "异常"]),
+    (["ZC_002", "用户名长度为1时注册失败", "验证用户名长度下限", "已打开注册页面", "1. 输入长度为1的用户名<br>2. 点击注册", "提示用户名长度为2-50个字符", "P2", "边界"],
+     ["ZC_003", "用户名长度为51时注册失败", "验证用户名长度上限", "已打开注册页面", "1. 输入长度为51的用户名<br>2. 点击注册", "提示用户名长度为2-50个字符", "P2", "边界"]),
+    (["ZC_004", "用户名长度为2时注册成功", "验证用户名长度下限", "已打开注册页面", "1. 输入长度为2的用户名<br>2. 点击注册", "注册成功", "P2", "边界"],
+     ["ZC_006", "用户名长度为50时注册成功", "验证用户名长度上限", "已打开注册页面", "1. 输入长度为50的用户名<br>2. 点击注册", "注册成功", "P2", "边界"]),
+    (["DL_005", "连续输错密码5次后账号锁定", "验证账号锁定策略", "已注册账号", "1. 连续5次输入错误密码", "提示账号已锁定，30分钟后重试", "P1", "安全"],
+     ["DL_006", "连续输错密码4次后账号未锁定", "验证锁定前的次数", "已注册账号", "1. 连续4次输入错误密码", "提示密码错误，还可尝试1次", "P1", "安全"]),
+    (["ZC_007", "手机号已注册时注册失败", "验证手机号唯一性", "手机号已注册", "1. 输入已注册的手机号<br>2. 获取验证码并提交", "提示该手机号已注册", "P1", "异常"],
+     ["ZC_008", "验证码错误时注册失败", "验证验证码校验", "已打开注册页面", "1. 输入未注册的手机号<br>2. 输入错误的验证码并提交", "提示验证码错误", "P1", "异常"]),
+    (["ZC_009", "用户名过长时注册失败", "验证用户名长度", "已打开注册页面", "1. 输入过长的用户名<br>2. 点击注册", "提示用户名过长", "P2", "异常"],
+     ["ZC_010", "用户名过短时注册失败", "验证用户名长度", "已打开注册页面", "1. 输入过短的用户名<br>2. 点击注册", "提示用户名过短", "P2", "异常"]),
+    (["ZH_002", "邮箱未绑定时找回密码失败", "验证未绑定邮箱的处理", "账号未绑定邮箱", "1. 点击忘记密码<br>2. 输入未绑定的邮箱<br>3. 点击发送", "提示该邮箱未绑定账号", "P1", "异常"],
+     ["ZH_001", "通过邮箱找回密码", "验证邮箱找回密码功能", "账号已绑定邮箱", "1. 点击忘记密码<br>2. 输入绑定的邮箱<br>3. 点击发送", "提示重置邮件已发送，邮箱收到重置链接", "P1", "功能"]),
+]
+
+
+def dedupe_pair(a, b, **kwargs):
+    return dedupe_testcases(HEADER + [join_case_row(a), join_case_row(b)], **kwargs)
+
+
+def test_paraphrases_are_merged():
+    for a, b in PARAPHRASES:
+        case_list, removed = dedupe_pair(a, b)
+        assert removed == 1, a[1]
+        assert len(case_list) == 3
+
+
+def test_distinct_cases_are_kept():
+    for a, b in DISTINCT:
+        _, removed = dedupe_pair(a, b)
+        assert removed == 0, (a[1], b[1])
+
+
+def test_most_complete_case_kept_in_first_position():
+    a, b = PARAPHRASES[0]
+    case_list, _ = dedupe_pair(a, b)
+    assert case_list[2] == join_case_row(b)
+
+
+def test_keep_protects_leading_cases():
+    a, b = PARAPHRASES[0]
+    case_list, removed = dedupe_pair(a, b, keep=1)
+    assert removed == 1
+    assert case_list[2] == join_case_row(a)
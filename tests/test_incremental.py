@@ -0,0 +1,61 @@
+from cases import data_rows, join_case_row, split_case_row
+from incremental import CHANGED, UNCHANGED, add_supplement_rows, build_case_list, diff_sections, load_state, \
+    prepare_sections, save_state
+
+PRD = ("## 登录\n1. 输入用户名\n2. 输入密码\n3. 点击登录\n"
+       "## 注册\n1. 输入手机号\n2. 获取验证码\n"
+       "## 找回密码\n1. 输入邮箱\n2. 点击发送")
+
+
+def case(case_id, title, expected="操作成功"):
+    return join_case_row([case_id, title, f"验证{title}", "已打开页面", f"1. {title}", expected, "P1", "功能"])
+
+
+def empty_state(doc_id="doc"):
+    return {"doc_id": doc_id, "prd": "", "counters": {}, "sections": [], "supplement": []}
+
+
+def first_run(prd=PRD):
+    sections = prepare_sections(prd)
+    plan, _ = diff_sections([], sections)
+    generated = {section["position"]: [case(f"DL_{section['position']:03d}", section["title"])]
+                 for section in sections}
+    return build_case_list("doc", prd, plan, generated, empty_state())
+
+
+def test_numbered_lists_keep_sections_apart():
+    _, state, _ = first_run()
+    sections = prepare_sections(PRD.replace("点击发送", "点击发送邮件"))
+    plan, removed = diff_sections(state["sections"], sections)
+    assert [(status, section["title"]) for status, section, _ in plan] == [
+        (UNCHANGED, "登录"), (UNCHANGED, "注册"), (CHANGED, "找回密码")]
+    assert removed == []
+
+
+def test_kept_cases_are_not_replaced_by_paraphrases():
+    case_list, state, _ = first_run()
+    sections = prepare_sections(PRD.replace("点击发送", "点击发送邮件"))
+    plan, _ = diff_sections(state["sections"], sections)
+    # 重新生成的章节中有一条与保留的用例近似重复，内容更完整也不能替换保留的用例
+    generated = {3: [case("X_001", "登录", "操作成功！"), case("X_002", "发送找回邮件")]}
+    new_list, new_state, duplicates = build_case_list("doc", PRD, plan, generated, state, dedupe_threshold=0.5)
+    kept = data_rows(case_list)[:2]
+    assert data_rows(new_list)[:2] == kept
+    assert duplicates == 1
+    assert [split_case_row(row)[1] for row in data_rows(new_list)[2:]] == ["发送找回邮件"]
+
+
+def test_supplement_rows_are_kept_in_next_run(tmp_path):
+    case_list, state, _ = first_run()
+    supplement = add_supplement_rows(state, [case("DL_001", "记住密码")])
+    assert split_case_row(supplement[0])[0] == "DL_004"
+    save_state(state, tmp_path)
+    state = load_state("doc", tmp_path)
+    plan, _ = diff_sections(state["sections"], prepare_sections(PRD))
+    new_list, new_state, _ = build_case_list("doc", PRD, plan, {}, state)
+    assert data_rows(new_list) == data_rows(case_list) + supplement
+    assert new_state["supplement"] == supplement
+
+
+def test_missing_state():
+    assert load_state("none", "/nonexistent") == empty_state("none")
@@ -0,0 +1,15 @@
+from jobs import JobStore
+
+
+HEADER = ["| 用例ID | 用例标题 |", "| --- | --- |"]
+
+
+def test_job_list_counts_only_data_rows(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.db"))
+    finished = store.create("finished")
+    running = store.create("running")
+    store.create("queued")
+    store.update(finished, case_list=HEADER + ["| A_1 | 登录 |", "| A_2 | 注册 |"])
+    store.update(running, rows=HEADER[:1] + ["| A_1 | 登录 |"])
+    counts = {job["label"]: job["cases"] for job in store.list()}
+    assert counts == {"finished": 2, "running": 1, "queued": 0}
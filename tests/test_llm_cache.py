@@ -0,0 +1,24 @@
+import asyncio
+from autogen_agentchat.messages import TextMessage
+from autogen_core.models import RequestUsage, UserMessage
+from autogen_ext.models.replay import ReplayChatCompletionClient
+from llm_cache import DiskCacheStore, ResponseCache
+from metrics import RunMetrics
+
+
+def test_cached_replies_record_zero_tokens(tmp_path):
+    client = ReplayChatCompletionClient(["第一次回复"])
+    client.set_cached_bool_value(False)
+    cache = ResponseCache(client, DiskCacheStore(str(tmp_path)))
+    messages = [UserMessage(content="生成用例", source="user")]
+    first = asyncio.run(cache.create(messages))
+    second = asyncio.run(cache.create(messages))
+    assert not first.cached and second.cached
+    assert second.content == first.content
+    assert second.usage == RequestUsage(prompt_tokens=0, completion_tokens=0)
+
+    metrics = RunMetrics()
+    for result in (first, second):
+        metrics.on_message(TextMessage(content=result.content, source="gen", models_usage=result.usage))
+    assert [turn["cached"] for turn in metrics.turns] == [False, True]
+    assert metrics.to_dict()["cached_turns"] == 1
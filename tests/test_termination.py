@@ -0,0 +1,25 @@
+import asyncio
+from autogen_agentchat.messages import TextMessage
+from termination import GEN_SOURCE, ConvergenceTermination
+
+TABLE = """| 用例ID | 用例标题 | 测试目标 | 前置条件 | 操作步骤 | 预期结果 | 优先级 | 测试类型 |
+|--------|--------|--------|--------|--------|--------|--------|--------|
+| DL_001 | 登录 | 验证登录 | 已注册 | 点击登录 | 登录成功 | P1 | 功能 |
+"""
+
+
+def stops(condition, content):
+    return asyncio.run(condition([TextMessage(content=content, source=GEN_SOURCE)])) is not None
+
+
+def test_replies_without_table_do_not_converge():
+    condition = ConvergenceTermination()
+    assert not stops(condition, TABLE)
+    assert not stops(condition, "好的，我将按评审意见修改")
+    assert not stops(condition, "收到")
+
+
+def test_revision_without_new_cases_converges():
+    condition = ConvergenceTermination()
+    assert not stops(condition, TABLE)
+    assert stops(condition, TABLE.replace("DL_001", "DL_002"))